@@ -3,17 +3,40 @@
 #----------------------------------------------------------------------------#
 
 import json
+import hmac
 import dateutil.parser
 import babel
 import sys
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify
+import sqlite3
+import time
+from datetime import date, datetime, timedelta, timezone
+from array import array
+from itertools import groupby
+import click
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, stream_with_context
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from pagination import paginate
+import search
+from cache import create_cache, cached_page, conditional_get
+import formatting
+import importer
+import exporter
+import seeder
+import instrumentation
+import timeouts
+import replicas
+import facets
+import templating
+import assets
+import compression
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -21,30 +44,87 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+page_cache = create_cache(app.config)
+fragment_cache = create_cache(app.config, 'FRAGMENT_CACHE')
+templating.init_app(app, fragment_cache)
+# part of every ETag, so a deploy with changed templates invalidates them
+page_version = templating.source_checksum(app)
+# fingerprinted CSS/JS bundles for asset_url() (see assets.py)
+assets.pipeline.init_app(app)
+
+# gzip/brotli response compression (see config.py); set up before the
+# metrics, which report on it
+if app.config.get('COMPRESSION_ENABLED'):
+    compression.init_app(app)
+
+# Prometheus metrics at /metrics (see config.py); this sets the engine's
+# pool class, so it has to come before the engine is created.
+if app.config.get('METRICS_ENABLED'):
+    import metrics
+    metrics.init_app(app, page_cache)
+
+db = SQLAlchemy(app, session_options={'class_': replicas.RoutingSession})
 migrate = Migrate(app, db)
 
 
+# SQLite only enforces foreign keys when asked to, on every connection;
+# deletes rely on them (ON DELETE CASCADE, see passive_deletes below).
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+with app.app_context():
+    for engine in db.engines.values():
+        db.event.listen(engine, 'connect', enable_sqlite_foreign_keys)
+
+timeouts.init_app(app, db)
+# GET requests read from the replicas, if any are configured
+replicas.router.init_app(app, db)
+
+# Server-Timing header and a JSON log line per request (see config.py).
+if app.config.get('REQUEST_TIMING'):
+    instrumentation.init_app(app)
+
+
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# Modification times are stored in UTC and feed the pages' ETags (see
+# "Conditional GET" below). Counter updates go through Core UPDATEs,
+# which apply onupdate too.
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 # Artist Model
 class Artist(db.Model):
     __tablename__ = 'artists'
+    __table_args__ = (
+        db.Index('ix_artists_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_artists_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_artists_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column("genres", db.ARRAY(db.String()), nullable=False)
+    genres = db.Column("genres", db.ARRAY(db.String()).with_variant(db.JSON(), 'sqlite'), nullable=False)
     image_link = db.Column(db.Text())
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
-    artist_shows = db.relationship('Show', backref='artist', cascade="all, delete-orphan", passive_deletes=True, lazy='joined')
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+    artist_shows = db.relationship('Show', backref='artist', cascade="all, delete-orphan", passive_deletes=True, lazy='raise_on_sql')
 
     def __repr__(self):
         return f'<Artist id: {self.id}, name: {self.name}>'
@@ -52,6 +132,13 @@ class Artist(db.Model):
 # Venue Model
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        db.Index('ix_venues_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_venues_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_venues_city_state', 'city', 'state'),
+        db.Index('ix_venues_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -59,13 +146,16 @@ class Venue(db.Model):
     state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column("genres", db.ARRAY(db.String()), nullable=False)
+    genres = db.Column("genres", db.ARRAY(db.String()).with_variant(db.JSON(), 'sqlite'), nullable=False)
     image_link = db.Column(db.Text())
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
-    venue_shows = db.relationship('Show', backref='venue', cascade="all, delete-orphan", passive_deletes=True, lazy='joined')
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+    venue_shows = db.relationship('Show', backref='venue', cascade="all, delete-orphan", passive_deletes=True, lazy='raise_on_sql')
 
     def __repr__(self):
         return f'<Venue id: {self.id}, name: {self.name}>'
@@ -73,6 +163,12 @@ class Venue(db.Model):
 # Show Model
 class Show(db.Model):
     __tablename__ = 'shows'
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_date', 'venue_id', 'start_date'),
+        db.Index('ix_shows_artist_id_start_date', 'artist_id', 'start_date'),
+        db.Index('ix_shows_start_date', 'start_date', 'id'),
+        db.Index('ix_shows_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey(
@@ -80,27 +176,600 @@ class Show(db.Model):
     venue_id = db.Column(db.Integer, db.ForeignKey(
         'venues.id', ondelete='CASCADE'), nullable=False)
     start_date = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    # whether the show is counted in the upcoming (rather than past)
+    # counters of its venue and artist; flipped by `flask rollover-shows`
+    upcoming = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
 
     def __repr__(self):
         return f'<Show id: {self.id}, Artist id: {self.artist_id}, Venue id: {self.venue_id}>'
 
 
+# Area Model
+# Summary of the venue directory, one row per city/state, maintained by
+# refresh_areas() from the write paths (see "Area directory" below).
+class Area(db.Model):
+    __tablename__ = 'area_summary'
+
+    city = db.Column(db.String(120), primary_key=True)
+    state = db.Column(db.String(120), primary_key=True)
+    venue_count = db.Column(db.Integer, nullable=False)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False)
+    # [{id, name, num_upcoming_shows, version}, ...] ordered by venue id
+    venues = db.Column(db.JSON, nullable=False)
+    # {genre: number of venues}
+    genre_counts = db.Column(db.JSON, nullable=False)
+
+    def __repr__(self):
+        return f'<Area {self.city}, {self.state}: {self.venue_count} venues>'
+
+
+# Show collections are never loaded implicitly; every view declares the
+# relationships it renders with loader options. With RAISE_ON_LAZY_LOAD
+# enabled, any other relationship access that would emit SQL fails the
+# request instead of silently issuing one query per row.
+def raise_on_unplanned_lazy_load(orm_execute_state):
+    if orm_execute_state.is_select and not orm_execute_state.is_relationship_load:
+        orm_execute_state.statement = orm_execute_state.statement.options(
+            db.raiseload('*', sql_only=True))
+
+
+if app.config.get('RAISE_ON_LAZY_LOAD'):
+    db.event.listen(db.session, 'do_orm_execute', raise_on_unplanned_lazy_load)
+
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry denormalized upcoming_shows_count/past_shows_count
+# columns. They are changed in the same transaction as the shows they
+# count, moved from upcoming to past by `flask rollover-shows`, and can be
+# verified or rebuilt from the shows table with `flask check-counters`.
+
+def show_counter_rows(owner_key, criterion):
+    # (owner id, upcoming shows, past shows) for the shows matching criterion
+    return db.session.query(
+        owner_key,
+        db.func.sum(db.case((Show.upcoming, 1), else_=0)),
+        db.func.sum(db.case((Show.upcoming, 0), else_=1))
+    ).filter(criterion).group_by(owner_key).all()
+
+
+def add_to_show_counters(model, deltas):
+    if deltas:
+        table = model.__table__
+        db.session.execute(table.update().where(table.c.id == db.bindparam('owner_id')).values(
+            upcoming_shows_count=table.c.upcoming_shows_count + db.bindparam('upcoming'),
+            past_shows_count=table.c.past_shows_count + db.bindparam('past')
+        ), deltas)
+
+
+def count_shows(criterion, sign=1):
+    # Add (sign=1) or remove (sign=-1) the shows matching criterion
+    # from the counters of their venues and artists.
+    mark_areas(Venue.id.in_(db.session.query(Show.venue_id).filter(criterion)))
+    for model, owner_key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        add_to_show_counters(model, [
+            {'owner_id': owner_id, 'upcoming': sign * upcoming, 'past': sign * past}
+            for owner_id, upcoming, past in show_counter_rows(owner_key, criterion)
+        ])
+
+
+def rollover_shows(current_date):
+    # Move shows that have started since the last run from the upcoming
+    # to the past counters. Returns the number of shows moved.
+    due = db.and_(Show.upcoming.is_(True), Show.start_date <= current_date)
+    mark_areas(Venue.id.in_(db.session.query(Show.venue_id).filter(due)))
+    for model, owner_key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        add_to_show_counters(model, [
+            {'owner_id': owner_id, 'upcoming': -upcoming, 'past': upcoming}
+            for owner_id, upcoming, past in show_counter_rows(owner_key, due)
+        ])
+    return Show.query.filter(due).update({Show.upcoming: False}, synchronize_session=False)
+
+
+def check_show_counters(rebuild=False, current_date=None):
+    # Compare the stored counters with the shows table and return the
+    # (model, id, stored, expected) mismatches. With rebuild, first
+    # re-derive every show's upcoming flag from current_date, then
+    # overwrite the counters that are off.
+    if rebuild:
+        Show.query.filter(Show.upcoming.is_(True), Show.start_date <= current_date).update(
+            {Show.upcoming: False}, synchronize_session=False)
+        Show.query.filter(Show.upcoming.is_(False), Show.start_date > current_date).update(
+            {Show.upcoming: True}, synchronize_session=False)
+
+    mismatches = []
+    for model, owner_key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        counted = db.session.query(
+            owner_key.label('owner_id'),
+            db.func.sum(db.case((Show.upcoming, 1), else_=0)).label('upcoming'),
+            db.func.sum(db.case((Show.upcoming, 0), else_=1)).label('past')
+        ).group_by(owner_key).subquery()
+        expected_upcoming = db.func.coalesce(counted.c.upcoming, 0)
+        expected_past = db.func.coalesce(counted.c.past, 0)
+        rows = db.session.query(
+            model.id, model.upcoming_shows_count, model.past_shows_count,
+            expected_upcoming, expected_past
+        ).outerjoin(counted, counted.c.owner_id == model.id).filter(db.or_(
+            model.upcoming_shows_count != expected_upcoming,
+            model.past_shows_count != expected_past
+        )).all()
+
+        for owner_id, upcoming, past, expected_upcoming, expected_past in rows:
+            mismatches.append((model, owner_id, (upcoming, past), (expected_upcoming, expected_past)))
+
+        if rebuild and rows:
+            table = model.__table__
+            db.session.execute(table.update().where(table.c.id == db.bindparam('owner_id')).values(
+                upcoming_shows_count=db.bindparam('upcoming'),
+                past_shows_count=db.bindparam('past')
+            ), [{'owner_id': row[0], 'upcoming': row[3], 'past': row[4]} for row in rows])
+
+    return mismatches
+
+
+@app.cli.command('rollover-shows')
+def rollover_shows_command():
+    """Move started shows from the upcoming to the past counters.
+
+    Meant to be scheduled (e.g. from cron every few minutes).
+    """
+    moved = rollover_shows(datetime.now())
+    db.session.commit()
+    if moved:
+        # counters changed on many pages at once
+        clear_page_caches()
+    print(f'{moved} show(s) moved from upcoming to past.')
+
+
+@app.cli.command('check-counters')
+@click.option('--rebuild', is_flag=True, help='Rewrite the counters that do not match.')
+def check_counters_command(rebuild):
+    """Verify the venue and artist show counters against the shows table."""
+    mismatches = check_show_counters(rebuild=rebuild, current_date=datetime.now())
+    if rebuild:
+        refresh_areas()
+    db.session.commit()
+    if rebuild and mismatches:
+        clear_page_caches()
+    for model, owner_id, stored, expected in mismatches:
+        print(f'{model.__name__} {owner_id}: upcoming/past {stored[0]}/{stored[1]}, '
+              f'expected {expected[0]}/{expected[1]}')
+    if rebuild:
+        print(f'{len(mismatches)} counter(s) rebuilt.')
+    elif mismatches:
+        sys.exit(1)
+    else:
+        print('All show counters are consistent.')
+
+
+#----------------------------------------------------------------------------#
+# Area directory.
+#----------------------------------------------------------------------------#
+
+# The /venues directory is served from the area_summary table. Writes
+# that change a venue's area, name or upcoming show count mark the areas
+# involved with mark_areas(), and those rows are recomputed right before
+# the transaction commits. Bulk loads rebuild the whole table.
+
+def mark_areas(criterion):
+    # remember the areas of the venues matching criterion, as they are now
+    areas = db.session.info.setdefault('dirty_areas', set())
+    areas.update(tuple(row) for row in db.session.query(Venue.city, Venue.state).filter(criterion).distinct())
+
+
+def mark_area(city, state):
+    db.session.info.setdefault('dirty_areas', set()).add((city, state))
+
+
+def area_row(city, state, venues):
+    genre_counts = {}
+    for venue in venues:
+        for genre in venue.genres or ():
+            genre_counts[genre] = genre_counts.get(genre, 0) + 1
+    return {
+        'city': city,
+        'state': state,
+        'venue_count': len(venues),
+        'upcoming_shows_count': sum(venue.upcoming_shows_count for venue in venues),
+        'venues': [{
+            'id': venue.id,
+            'name': venue.name,
+            'num_upcoming_shows': venue.upcoming_shows_count,
+            # as migration e5c9a2f47b13 writes it
+            'version': venue.updated_at.isoformat(timespec='microseconds')
+        } for venue in venues],
+        'genre_counts': genre_counts,
+    }
+
+
+def upsert_areas(rows, columns):
+    # INSERT ... ON CONFLICT (city, state) DO UPDATE SET columns (or the
+    # column expressions given in a dict)
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    insert = dialect.insert(Area.__table__).values(rows)
+    if not isinstance(columns, dict):
+        columns = {column: insert.excluded[column] for column in columns}
+    db.session.execute(insert.on_conflict_do_update(index_elements=['city', 'state'], set_=columns))
+
+
+def refresh_areas(areas=None, batch_size=1000):
+    # Recompute the summary rows of the given (city, state) pairs, or of
+    # every area when areas is None.
+    if areas is None:
+        areas = set(db.session.query(Area.city, Area.state)) | set(
+            db.session.query(Venue.city, Venue.state).distinct())
+    # sorted, so concurrent writers lock shared areas in the same order
+    areas = sorted(tuple(area) for area in areas)
+    for start in range(0, len(areas), batch_size):
+        refresh_area_batch(areas[start:start + batch_size])
+
+
+def refresh_area_batch(areas):
+    table = Area.__table__
+    # Lock the rows first, creating empty ones for new areas. A concurrent
+    # writer refreshing the same areas waits here until this transaction
+    # ends; its venue query below, a new statement under READ COMMITTED,
+    # then sees what this one committed, so neither overwrites the other.
+    upsert_areas([area_row(city, state, []) for city, state in areas],
+                 {'venue_count': table.c.venue_count})
+
+    rows = db.session.query(
+        Venue.city, Venue.state, Venue.id, Venue.name, Venue.genres, Venue.upcoming_shows_count,
+        Venue.updated_at
+    ).filter(db.tuple_(Venue.city, Venue.state).in_(areas)).order_by(Venue.city, Venue.state, Venue.id).all()
+    summaries = [area_row(city, state, list(venues))
+                 for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state))]
+    if summaries:
+        upsert_areas(summaries, ['venue_count', 'upcoming_shows_count', 'venues', 'genre_counts'])
+
+    # areas left without venues drop out of the directory
+    empty = set(areas) - {(summary['city'], summary['state']) for summary in summaries}
+    if empty:
+        db.session.execute(table.delete().where(db.tuple_(table.c.city, table.c.state).in_(empty)))
+
+
+@db.event.listens_for(db.session, 'before_commit')
+def refresh_marked_areas(session):
+    areas = session.info.pop('dirty_areas', None)
+    if areas:
+        refresh_areas(areas)
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def forget_marked_areas(session):
+    session.info.pop('dirty_areas', None)
+
+
+@app.cli.command('refresh-areas')
+def refresh_areas_command():
+    """Rebuild the venue directory's area summary from the venues table."""
+    refresh_areas()
+    db.session.commit()
+    clear_page_caches()
+    print(f'{Area.query.count()} area(s) refreshed.')
+
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+# Venue and artist detail pages and the venue directory are cached as
+# rendered HTML under these keys. The write handlers drop exactly the
+# pages a change shows up on, after their transaction commits.
+
+def show_related_ids(column, criterion):
+    return [row[0] for row in db.session.query(column).filter(criterion).distinct()]
+
+
+def invalidate_pages(venue_ids=(), artist_ids=(), areas=False):
+    keys = [f'venue:{venue_id}' for venue_id in venue_ids]
+    keys += [f'artist:{artist_id}' for artist_id in artist_ids]
+    if areas:
+        keys.append('areas')
+    page_cache.delete_many(*keys)
+
+
+# Template fragments ({% cache %} blocks) are invalidated the same way:
+# a venue's directory entry when its name or counters change, a show's
+# tile when the show or its venue or artist changes.
+def invalidate_fragments(venue_ids=(), show_ids=()):
+    fragment_cache.delete_many(
+        *[templating.fragment_key('venue', venue_id) for venue_id in venue_ids],
+        *[templating.fragment_key('show', show_id) for show_id in show_ids])
+
+
+def clear_page_caches():
+    page_cache.clear()
+    fragment_cache.clear()
+
+
+#  Conditional GET
+#  ----------------------------------------------------------------
+
+# Detail pages and listings send an ETag derived from the updated_at
+# columns and row counts of what they show, fetched in a single query
+# before the view runs; a client whose copy is current gets a 304 without
+# any of the page's queries or rendering.
+
+def listing_validator(*models):
+    # (max(updated_at), count) over each of the models' tables, plus any
+    # extra scalar subqueries the caller passes, in the same query
+    def validator(*extra):
+        columns = []
+        for model in models:
+            columns.append(db.select(db.func.max(model.updated_at)).scalar_subquery())
+            columns.append(db.select(db.func.count(model.id)).scalar_subquery())
+        return tuple(db.session.query(*columns, *extra).one())
+    return validator
+
+
+def detail_validator(model, show_key, other, other_key, id):
+    # the row's own updated_at, plus the latest change to its shows and to
+    # the venues/artists they list, and the number of shows
+    row = db.session.query(
+        model.updated_at,
+        db.func.max(Show.updated_at),
+        db.func.max(other.updated_at),
+        db.func.count(Show.id)
+    ).outerjoin(Show, show_key == model.id).outerjoin(other, other_key == other.id).filter(
+        model.id == id
+    ).group_by(model.id).first()
+    return None if row is None else tuple(row)
+
+
+show_tables_validator = listing_validator(Show, Venue, Artist)
+
+
+def shows_page_validator():
+    # the default windows move with the clock: upcoming shows lose one as
+    # it starts, and this month's calendar changes with the date
+    next_start = db.select(db.func.min(Show.start_date)).where(
+        Show.start_date >= datetime.now()).scalar_subquery()
+    return show_tables_validator(next_start) + (date.today().isoformat(),)
+
+
+def venue_page_validator(venue_id):
+    return detail_validator(Venue, Show.venue_id, Artist, Show.artist_id, venue_id)
+
+
+def artist_page_validator(artist_id):
+    return detail_validator(Artist, Show.artist_id, Venue, Show.venue_id, artist_id)
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(page_cache.info())
+
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
 
 def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+    # accepts datetimes as well as strings; see formatting.py
+    return formatting.format_datetime(value, format, app.config['DATETIME_LOCALE'])
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+
+def limit_search_time():
+    # searches get a tighter statement budget than the rest of the request
+    if app.config['SEARCH_STATEMENT_TIMEOUT_MS']:
+        timeouts.limit_statement_time(db.session.connection(), app.config['SEARCH_STATEMENT_TIMEOUT_MS'])
+
+
+def search_names(model, search_term):
+    # One ranked, index-backed query returns a page of hits plus the total
+    # number of matches (the `total` column of every hit row).
+    limit_search_time()
+    engine = search.engine_for(db.engine.dialect.name)
+    hits = engine.hits(db.session, model, search_term)
+    return paginate(db.session.query(hits), (hits.c.score, hits.c.id),
+                    after=request.args.get('after'),
+                    before=request.args.get('before'),
+                    per_page=app.config['ITEMS_PER_PAGE'],
+                    descending=True)
+
+
+@app.cli.command('search-index')
+def search_index_command():
+    """Create the name search indexes for the configured database."""
+    engine = search.engine_for(db.engine.dialect.name)
+    with db.engine.begin() as connection:
+        for model in (Venue, Artist):
+            engine.create_index(connection, model)
+    print(f'Search indexes ready ({engine.name}).')
+
+#----------------------------------------------------------------------------#
+# Directory filters.
+#----------------------------------------------------------------------------#
+
+
+def directory_filters():
+    # genre (repeatable, all must match), city, state and seeking=1,
+    # from the query string of /venues and /artists
+    return {
+        'genre': [genre for genre in request.args.getlist('genre') if genre],
+        'city': request.args.get('city', '').strip(),
+        'state': request.args.get('state', '').strip(),
+        'seeking': request.args.get('seeking') == '1',
+    }
+
+
+def directory_criteria(model, seeking_column, filters):
+    criteria = []
+    if filters['genre']:
+        criteria.append(facets.has_genres(model.genres, filters['genre'], db.engine.dialect.name))
+    if filters['city']:
+        criteria.append(model.city == filters['city'])
+    if filters['state']:
+        criteria.append(model.state == filters['state'])
+    if filters['seeking']:
+        criteria.append(seeking_column.is_(True))
+    return criteria
+
+
+def directory_facets(model, criteria, filters):
+    # per-genre counts of the filtered rows, from a single aggregate
+    return [{
+        'genre': row.genre,
+        'count': row.count,
+        'selected': row.genre in filters['genre'],
+    } for row in facets.genre_counts(db.session, model, criteria, db.engine.dialect.name)]
+
+
+def filter_args(filters):
+    # the filters again as url_for() arguments, e.g. for the pager; a set
+    # flag goes back as '1', the only value directory_filters() accepts
+    return {key: '1' if value is True else value for key, value in filters.items() if value}
+
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+
+def count_imported_shows(resource, rows):
+    # imported shows join the counters in the same transaction as their batch
+    if resource != 'shows':
+        return
+    for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+        totals = {}
+        for row in rows:
+            counts = totals.setdefault(row[key], [0, 0])
+            counts[0 if row['upcoming'] else 1] += 1
+        add_to_show_counters(model, [
+            {'owner_id': owner_id, 'upcoming': upcoming, 'past': past}
+            for owner_id, (upcoming, past) in totals.items()
+        ])
+
+
+@app.cli.command('import')
+@click.argument('resource', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+              help='Input format; guessed from the file extension by default.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per INSERT/COPY and commit.')
+@click.option('--max-errors', default=20, show_default=True, help='Rejected rows to print.')
+def import_command(resource, path, file_format, batch_size, max_errors):
+    """Bulk-load venues, artists or shows from a CSV or JSON lines file.
+
+    Rows are validated like the create forms. Shows may reference their
+    venue and artist by venue_id/artist_id or by venue_name/artist_name.
+    """
+    records = importer.read_records(path, file_format)
+    shown = 0
+    progress = None
+    for progress in importer.run_import(db.session, db.metadata, resource, records,
+                                        batch_size=batch_size, after_batch=count_imported_shows):
+        for line_no, errors in progress.errors:
+            if shown < max_errors:
+                print(f'  line {line_no} rejected: ' + '; '.join(
+                    f'{field}: {" ".join(messages)}' for field, messages in errors.items()))
+            shown += 1
+        print(f'{resource}: {progress.read} read, {progress.inserted} inserted, '
+              f'{progress.rejected} rejected ({progress.rate:.0f} rows/s)')
+    if progress is not None and progress.inserted:
+        refresh_areas()
+        db.session.commit()
+        clear_page_caches()
+
+#----------------------------------------------------------------------------#
+# Seed data.
+#----------------------------------------------------------------------------#
+
+
+def next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+@app.cli.command('seed')
+@click.option('--venues', default=1000, show_default=True)
+@click.option('--artists', default=5000, show_default=True)
+@click.option('--shows', default=100000, show_default=True)
+@click.option('--seed', default=0, show_default=True, help='Same seed and sizes, same data.')
+@click.option('--skew', default=1.0, show_default=True, help='Zipf exponent of venue/artist/city popularity.')
+@click.option('--cities', default=2000, show_default=True, help='Distinct cities to spread rows over.')
+@click.option('--anchor', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Date the shows are spread around (default: today).')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per INSERT/COPY and commit.')
+def seed_command(venues, artists, shows, seed, skew, cities, anchor, batch_size):
+    """Generate a deterministic synthetic dataset for scale testing.
+
+    Rows are added after any existing ones, e.g. for production size:
+    flask seed --venues 100000 --artists 500000 --shows 10000000
+    """
+    plan = seeder.SeedPlan(seed=seed, venues=venues, artists=artists, shows=shows, skew=skew,
+                           cities=cities, anchor=anchor)
+    first_venue_id, first_artist_id = next_id(Venue), next_id(Artist)
+    seed_started = time.monotonic()
+
+    for model, rows in ((Venue, seeder.venue_rows(plan, first_venue_id)),
+                        (Artist, seeder.artist_rows(plan, first_artist_id))):
+        started = time.monotonic()
+        inserted = 0
+        for batch in seeder.batched(rows, batch_size):
+            importer.insert_rows(db.session, model.__table__, batch)
+            db.session.commit()
+            inserted += len(batch)
+        if db.engine.dialect.name == 'postgresql':
+            # ids were set explicitly, move the sequence past them
+            db.session.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence('{model.__tablename__}', 'id'), "
+                f"(SELECT max(id) FROM {model.__tablename__}))"))
+            db.session.commit()
+        print(f'{model.__tablename__}: {inserted} inserted ({time.monotonic() - started:.1f}s)')
+
+    # show counters are tallied here and written once at the end
+    # rather than with an UPDATE per batch
+    counts = {
+        Venue: (array('q', [0]) * venues, array('q', [0]) * venues, first_venue_id, 'venue_id'),
+        Artist: (array('q', [0]) * artists, array('q', [0]) * artists, first_artist_id, 'artist_id'),
+    }
+    started = time.monotonic()
+    inserted = 0
+    for batch in seeder.show_rows(plan, first_venue_id, first_artist_id, batch_size):
+        importer.insert_rows(db.session, Show.__table__, batch)
+        db.session.commit()
+        for upcoming, past, first_id, key in counts.values():
+            for row in batch:
+                (upcoming if row['upcoming'] else past)[row[key] - first_id] += 1
+        inserted += len(batch)
+        print(f'shows: {inserted}/{shows} inserted ({inserted / (time.monotonic() - started):.0f} rows/s)')
+
+    for model, (upcoming, past, first_id, key) in counts.items():
+        deltas = ({'owner_id': first_id + offset, 'upcoming': upcoming[offset], 'past': past[offset]}
+                  for offset in range(len(upcoming)) if upcoming[offset] or past[offset])
+        for batch in seeder.batched(deltas, batch_size):
+            add_to_show_counters(model, batch)
+        db.session.commit()
+    refresh_areas()
+    db.session.commit()
+    clear_page_caches()
+    print(f'Seeded {venues} venues, {artists} artists and {shows} shows in '
+          f'{time.monotonic() - seed_started:.1f}s.')
+
+
+#  Static assets
+#  ----------------------------------------------------------------
+
+@app.cli.command('assets')
+def assets_command():
+    """Build the fingerprinted, precompressed CSS/JS bundles."""
+    assets.pipeline.manifest = assets.build(app.static_folder)
+    for name, filename in assets.pipeline.manifest.items():
+        print(f'{name}: {app.static_url_path}/{assets.BUILD_DIR}/{filename}')
+
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -118,77 +787,95 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@conditional_get(listing_validator(Venue), page_version)
+@cached_page(page_cache, 'areas')
 def venues():
     # TODO: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-    # Define Variables
-    current_date = datetime.now()
-
     data = []
-
-    # Group areas by city and state
-    areas = Venue.query.with_entities(Venue.city, Venue.state).group_by(Venue.city, Venue.state).all()
-       
-    # Loop throw each area
-    for area in areas:
-        data_venues = []
-
-        # Get venues by area
-        venues = Venue.query.filter_by(city=area.city, state=area.state).all()
-        
-        # Loop throw each venue
-        for venue in venues:
-            # Get upcoming shows by venue
-            upcoming_shows = Show.query.filter(Show.venue_id==venue.id, Show.start_date > current_date).all()
-                    
-            # Map venues
-            data_venues.append({
-                'id': venue.id,
-                'name': venue.name,
-                'num_upcoming_shows': len(upcoming_shows)
+    filters = directory_filters()
+
+    if not filter_args(filters):
+        # The unfiltered directory is read from the area summary alone
+        areas = Area.query.order_by(Area.city, Area.state).all()
+        genre_counts = {}
+        for area in areas:
+            data.append({
+                'city': area.city,
+                'state': area.state,
+                'num_upcoming_shows': area.upcoming_shows_count,
+                'venues': area.venues
             })
-
+            for genre, count in area.genre_counts.items():
+                genre_counts[genre] = genre_counts.get(genre, 0) + count
+        facet_list = [{'genre': genre, 'count': count, 'selected': False}
+                      for genre, count in sorted(genre_counts.items(), key=lambda item: (-item[1], item[0]))]
+        return render_template('pages/venues.html', areas=data, filters=filters, states=state_choices,
+                               facets=facet_list)
+
+    # Filtered: one query for the matching venues with their area and
+    # maintained upcoming show counter, ordered so that venues of the
+    # same area come out next to each other.
+    criteria = directory_criteria(Venue, Venue.seeking_talent, filters)
+    rows = db.session.query(
+        Venue.city, Venue.state, Venue.id, Venue.name,
+        Venue.upcoming_shows_count.label('num_upcoming_shows'), Venue.updated_at
+    ).filter(*criteria).order_by(
+        Venue.city, Venue.state, Venue.id
+    ).all()
+
+    # Group venues by city and state
+    for (city, state), area_rows in groupby(rows, key=lambda row: (row.city, row.state)):
+        area_rows = list(area_rows)
         # Map areas
         data.append({
-            'city': area.city,
-            'state': area.state,
-            'venues': data_venues
+            'city': city,
+            'state': state,
+            'num_upcoming_shows': sum(row.num_upcoming_shows for row in area_rows),
+            'venues': [{
+                'id': row.id,
+                'name': row.name,
+                'num_upcoming_shows': row.num_upcoming_shows,
+                'version': row.updated_at.isoformat(timespec='microseconds')
+            } for row in area_rows]
         })
 
-    return render_template('pages/venues.html', areas=data)
+    return render_template('pages/venues.html', areas=data, filters=filters, states=state_choices,
+                           facets=directory_facets(Venue, criteria, filters))
 
 
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
 
-    search_term = request.form.get('search_term', '')
-    search_result = Venue.query.filter(Venue.name.ilike(f'%{search_term}%'))
+    search_term = request.values.get('search_term', '')
+    page = search_names(Venue, search_term)
 
     response = {
-        'count': search_result.count(),
-        'data': search_result,
+        'count': page.items[0].total if page.items else 0,
+        'data': page.items,
     }
 
-    return render_template('pages/search_venues.html', results=response, search_term=search_term)
+    return render_template('pages/search_venues.html', results=response, search_term=search_term, page=page)
 
 
 @app.route('/venues/<int:venue_id>')
+@conditional_get(venue_page_validator, page_version)
+@cached_page(page_cache, 'venue:{venue_id}')
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
     # TODO: replace with real venue data from the venues table, using venue_id
 
     # Fetch required data from database
     venue = Venue.query.get(venue_id)
-    shows = Show.query.filter_by(venue_id=venue_id).all()
+    shows = Show.query.options(db.joinedload(Show.artist)).filter_by(venue_id=venue_id).all()
 
     # Define some helper variables
     finished_shows = []
     upcoming_shows = []
-    current_date = datetime.now()
 
     # Loop throw shows to set finished_shows and upcoming_shows
     for show in shows:
@@ -206,10 +893,10 @@ def show_venue(venue_id):
             'venue_id': show.venue_id,
             'artist_name': show.artist.name,
             'artist_image_link': artist_image_link,
-            'start_time': format_datetime(str(show.start_date))
+            'start_time': show.start_date
         }
 
-        if show.start_date > current_date:
+        if show.upcoming:
             upcoming_shows.append(data)
         else:
             finished_shows.append(data)
@@ -230,8 +917,8 @@ def show_venue(venue_id):
         "image_link": venue.image_link,
         "past_shows": finished_shows,
         "upcoming_shows": upcoming_shows,
-        "past_shows_count": len(finished_shows),
-        "upcoming_shows_count": len(upcoming_shows)
+        "past_shows_count": venue.past_shows_count,
+        "upcoming_shows_count": venue.upcoming_shows_count
     }
 
     return render_template('pages/show_venue.html', venue=data)
@@ -283,7 +970,9 @@ def create_venue_submission():
         )
         # Insert into Database
         db.session.add(venue)
+        mark_area(city, state)
         db.session.commit()
+        invalidate_pages(areas=True)
     except:
         error = True
         db.session.rollback()
@@ -310,8 +999,15 @@ def delete_venue(venue_id):
     try:
         venue = Venue.query.get(venue_id)
         venue_name = venue.name
+        # the venue's shows go with it, so take them off their artists' counters
+        artist_ids = show_related_ids(Show.artist_id, Show.venue_id == venue_id)
+        show_ids = show_related_ids(Show.id, Show.venue_id == venue_id)
+        count_shows(Show.venue_id == venue_id, sign=-1)
+        mark_area(venue.city, venue.state)
         db.session.delete(venue)
         db.session.commit()
+        invalidate_pages(venue_ids=[venue_id], artist_ids=artist_ids, areas=True)
+        invalidate_fragments(venue_ids=[venue_id], show_ids=show_ids)
         flash('Venue ' + venue_name +
             ' has been removed successfully', 'success')
     except:
@@ -329,54 +1025,63 @@ def delete_venue(venue_id):
 
 
 @app.route('/artists')
+@conditional_get(listing_validator(Artist), page_version)
 def artists():
     # TODO: replace with real data returned from querying the database
 
     data = []
 
-    artists = Artist.query.order_by(Artist.id).all()
+    filters = directory_filters()
+    criteria = directory_criteria(Artist, Artist.seeking_venue, filters)
+    page = paginate(Artist.query.with_entities(Artist.id, Artist.name).filter(*criteria), (Artist.id,),
+                    after=request.args.get('after'),
+                    before=request.args.get('before'),
+                    per_page=app.config['ITEMS_PER_PAGE'])
 
-    for artist in artists:
+    for artist in page.items:
         # mapping artists into data list
         data.append({
             'id': artist.id,
             'name': artist.name
         })
 
-    return render_template('pages/artists.html', artists=data)
+    return render_template('pages/artists.html', artists=data, page=page, filters=filters,
+                           filter_args=filter_args(filters), states=state_choices,
+                           facets=directory_facets(Artist, criteria, filters))
 
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
 
     # Define Variables
-    search_term = request.form.get('search_term', '')
-    search_result = Artist.query.filter(Artist.name.ilike(f'%{search_term}%'))
+    search_term = request.values.get('search_term', '')
+    page = search_names(Artist, search_term)
 
     response = {
-        'count': search_result.count(),
-        'data': search_result,
+        'count': page.items[0].total if page.items else 0,
+        'data': page.items,
     }
 
-    return render_template('pages/search_artists.html', results=response, search_term=search_term)
+    return render_template('pages/search_artists.html', results=response, search_term=search_term, page=page)
 
 
 @app.route('/artists/<int:artist_id>')
+@conditional_get(artist_page_validator, page_version)
+@cached_page(page_cache, 'artist:{artist_id}')
 def show_artist(artist_id):
     # shows the venue page with the given venue_id
     # TODO: replace with real venue data from the venues table, using venue_id
 
     # Fetch required data from database
     artist = Artist.query.get(artist_id)
-    shows = Show.query.filter_by(artist_id=artist_id).all()
+    shows = Show.query.options(db.joinedload(Show.venue)).filter_by(artist_id=artist_id).all()
 
     # Define some helper variables
     finished_shows = []
     upcoming_shows = []
-    current_date = datetime.now()
 
     # Loop throw shows to set finished_shows and upcoming_shows
     for show in shows:
@@ -394,10 +1099,10 @@ def show_artist(artist_id):
             'venue_id': show.venue_id,
             'venue_name': show.venue.name,
             'venue_image_link': venue_image_link,
-            'start_time': format_datetime(str(show.start_date))
+            'start_time': show.start_date
         }
 
-        if show.start_date > current_date:
+        if show.upcoming:
             upcoming_shows.append(data)
         else:
             finished_shows.append(data)
@@ -424,8 +1129,8 @@ def show_artist(artist_id):
         "image_link": artist_image_link,
         "past_shows": finished_shows,
         "upcoming_shows": upcoming_shows,
-        "past_shows_count": len(finished_shows),
-        "upcoming_shows_count": len(upcoming_shows)
+        "past_shows_count": artist.past_shows_count,
+        "upcoming_shows_count": artist.upcoming_shows_count
     }
 
     return render_template('pages/show_artist.html', artist=data)
@@ -469,7 +1174,12 @@ def edit_artist_submission(artist_id):
         artist.website= form.website.data
         artist.seeking_venue= form.seeking_venue.data
         artist.seeking_description= form.seeking_description.data
+        # the artist's name and image also appear on its venues' pages
+        venue_ids = show_related_ids(Show.venue_id, Show.artist_id == artist_id)
+        show_ids = show_related_ids(Show.id, Show.artist_id == artist_id)
         db.session.commit()
+        invalidate_pages(venue_ids=venue_ids, artist_ids=[artist_id])
+        invalidate_fragments(show_ids=show_ids)
     except:
         error = True
         db.session.rollback()
@@ -509,6 +1219,8 @@ def edit_venue_submission(venue_id):
     venue = Venue.query.get(venue_id)
     
     try:
+        # the venue may move to another area
+        mark_area(venue.city, venue.state)
         # updating database
         venue.name = form.name.data
         venue.city = form.city.data
@@ -521,7 +1233,13 @@ def edit_venue_submission(venue_id):
         venue.website= form.website.data
         venue.seeking_talent= form.seeking_talent.data
         venue.seeking_description= form.seeking_description.data
+        mark_area(venue.city, venue.state)
+        # the venue's name and image also appear on its artists' pages
+        artist_ids = show_related_ids(Show.artist_id, Show.venue_id == venue_id)
+        show_ids = show_related_ids(Show.id, Show.venue_id == venue_id)
         db.session.commit()
+        invalidate_pages(venue_ids=[venue_id], artist_ids=artist_ids, areas=True)
+        invalidate_fragments(venue_ids=[venue_id], show_ids=show_ids)
     except:
         error = True
         db.session.rollback()
@@ -607,8 +1325,14 @@ def delete_artist(artist_id):
     try:
         artist = Artist.query.get(artist_id)
         artist_name = artist.name
+        # the artist's shows go with it, so take them off their venues' counters
+        venue_ids = show_related_ids(Show.venue_id, Show.artist_id == artist_id)
+        show_ids = show_related_ids(Show.id, Show.artist_id == artist_id)
+        count_shows(Show.artist_id == artist_id, sign=-1)
         db.session.delete(artist)
         db.session.commit()
+        invalidate_pages(venue_ids=venue_ids, artist_ids=[artist_id], areas=True)
+        invalidate_fragments(venue_ids=venue_ids, show_ids=show_ids)
         flash('Artist ' + artist_name +
             ' has been removed successfully', 'success')
     except:
@@ -622,35 +1346,140 @@ def delete_artist(artist_id):
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
-def shows():
-    # displays list of shows at /shows
-    # TODO: replace with real venues data.
-
-    shows = Show.query.order_by(db.desc(Show.start_date)).all()
-
+def show_listing_query():
+    # Show rows with the artist and venue columns the listings need,
+    # joined in SQL so no Show, Artist or Venue entities are loaded.
+    return db.session.query(
+        Show.id,
+        Show.start_date,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.updated_at,
+        Venue.updated_at.label('venue_updated_at'),
+        Artist.updated_at.label('artist_updated_at')
+    ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+
+
+def show_listing_data(rows):
     data = []
 
-    for show in shows:
-        # set default image if show.artist.image_link is empty so that the image won't break
+    for show in rows:
+        # set default image if show.artist_image_link is empty so that the image won't break
         default_image = 'https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80'
 
-        if show.artist.image_link:
-            artist_image_link = show.artist.image_link
+        if show.artist_image_link:
+            artist_image_link = show.artist_image_link
         else:
             artist_image_link = default_image
 
         # mapping shows into data list
         data.append({
+            'show_id': show.id,
             'venue_id': show.venue_id,
-            'venue_name': show.venue.name,
+            'venue_name': show.venue_name,
             'artist_id': show.artist_id,
-            'artist_name': show.artist.name,
+            'artist_name': show.artist_name,
             'artist_image_link': artist_image_link,
-            'start_time': format_datetime(str(show.start_date))
+            'start_time': show.start_date,
+            # the tile's fragment cache version
+            'version': max(show.updated_at, show.venue_updated_at, show.artist_updated_at).isoformat()
         })
 
-    return render_template('pages/shows.html', shows=data)
+    return data
+
+
+def parse_day(name):
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (ValueError, OverflowError):
+        abort(400, f'Invalid {name} date, expected YYYY-MM-DD.')
+
+
+def show_filters():
+    # from and to (YYYY-MM-DD, both days included), venue and artist ids,
+    # from the query string of /shows and /shows/calendar
+    return {
+        'from': parse_day('from'),
+        'to': parse_day('to'),
+        'venue': request.args.get('venue', type=int),
+        'artist': request.args.get('artist', type=int),
+    }
+
+
+def show_criteria(filters):
+    # Ranges on start_date, so they are answered by ix_shows_start_date
+    # or, for one venue or artist, by its (venue_id/artist_id, start_date)
+    # index. Without from or to, the window is the upcoming shows, from
+    # now on.
+    start, end = filters['from'], filters['to']
+    criteria = []
+    if start is None and end is None:
+        criteria.append(Show.start_date >= datetime.now())
+    if start is not None:
+        criteria.append(Show.start_date >= datetime.combine(start, datetime.min.time()))
+    if end is not None:
+        try:
+            end = end + timedelta(days=1)
+        except OverflowError:  # to=9999-12-31
+            abort(400, 'Invalid to date, it is past the last supported day.')
+        criteria.append(Show.start_date < datetime.combine(end, datetime.min.time()))
+    if filters['venue'] is not None:
+        criteria.append(Show.venue_id == filters['venue'])
+    if filters['artist'] is not None:
+        criteria.append(Show.artist_id == filters['artist'])
+    return criteria
+
+
+@app.route('/shows')
+@conditional_get(shows_page_validator, page_version)
+def shows():
+    # displays list of shows at /shows
+    # TODO: replace with real venues data.
+
+    # soonest first, keyed on (start_date, id) so pages never overlap
+    filters = show_filters()
+    page = paginate(show_listing_query().filter(*show_criteria(filters)), (Show.start_date, Show.id),
+                    after=request.args.get('after'),
+                    before=request.args.get('before'),
+                    per_page=app.config['ITEMS_PER_PAGE'])
+
+    return render_template('pages/shows.html', shows=show_listing_data(page.items), page=page,
+                           filters=filters, filter_args=filter_args(filters))
+
+
+@app.route('/shows/calendar')
+@conditional_get(shows_page_validator, page_version)
+def shows_calendar():
+    # Number of shows on each day of ?month=YYYY-MM (this month by
+    # default), narrowed by venue/artist like /shows, from one aggregate
+    # query: no show rows are loaded. Days without shows are left out.
+    month = request.args.get('month', '').strip()
+    try:
+        first_day = datetime.strptime(month, '%Y-%m') if month else datetime.combine(
+            date.today().replace(day=1), datetime.min.time())
+        next_month = (first_day + timedelta(days=32)).replace(day=1)
+    except (ValueError, OverflowError):
+        abort(400, 'Invalid month, expected YYYY-MM.')
+
+    filters = dict(show_filters(), **{'from': first_day.date(), 'to': next_month.date() - timedelta(days=1)})
+    day = db.func.date(Show.start_date)
+    rows = db.session.query(day, db.func.count(Show.id)).filter(
+        *show_criteria(filters)
+    ).group_by(day).order_by(day).all()
+
+    # SQLite's date() gives a string, PostgreSQL's a date
+    days = {value if isinstance(value, str) else value.isoformat(): count for value, count in rows}
+    return jsonify({
+        'month': first_day.strftime('%Y-%m'),
+        'days': days,
+        'total': sum(days.values()),
+    })
 
 
 @app.route('/shows/create')
@@ -671,15 +1500,21 @@ def create_show_submission():
     start_date = request.form.get('start_time')
 
     try:
+        start_date = dateutil.parser.parse(start_date)
         # Pass Variables to Artist model
         show = Show(
             artist_id=artist_id,
             venue_id=venue_id,
             start_date=start_date,
+            upcoming=start_date > datetime.now()
         )
         # Insert into Database
         db.session.add(show)
+        db.session.flush()
+        count_shows(Show.id == show.id)
         db.session.commit()
+        invalidate_pages(venue_ids=[venue_id], artist_ids=[artist_id], areas=True)
+        invalidate_fragments(venue_ids=[venue_id])
     except:
         error = True
         db.session.rollback()
@@ -699,31 +1534,160 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
-@app.route('/shows/search', methods=['POST'])
+@app.route('/shows/<int:show_id>/delete', methods=['DELETE'])
+def delete_show(show_id):
+
+    try:
+        show = Show.query.get(show_id)
+        venue_id, artist_id = show.venue_id, show.artist_id
+        count_shows(Show.id == show_id, sign=-1)
+        db.session.delete(show)
+        db.session.commit()
+        invalidate_pages(venue_ids=[venue_id], artist_ids=[artist_id], areas=True)
+        invalidate_fragments(venue_ids=[venue_id], show_ids=[show_id])
+        flash('Show has been removed successfully', 'success')
+    except:
+        flash('Sorry! Something went wrong, Show could not be removed', 'danger')
+        db.session.rollback()
+    finally:
+        db.session.close()
+    return jsonify({'success': True})
+
+
+@app.route('/shows/search', methods=['GET', 'POST'])
 def search_shows():
     # Search shows by venue or artist name
 
     # Define Variables
-    search_term = request.form.get('search_term', '')
-    venues = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
-    if len(venues) > 0:
-        for venue in venues:
-            search_result = Show.query.filter_by(venue_id=venue.id).all()
-    else:
-        artists = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
-        if len(artists) > 0:
-            for artist in artists:
-                search_result = Show.query.filter_by(artist_id=artist.id).all()
-        else:
-            search_result = ''
+    search_term = request.values.get('search_term', '')
+    pattern = f'%{search.escape_like(search_term)}%'
+
+    # One query matches either name; the window count carries the total
+    limit_search_time()
+    hits = show_listing_query().add_columns(
+        db.func.count().over().label('total')
+    ).filter(db.or_(
+        Venue.name.ilike(pattern, escape='\\'),
+        Artist.name.ilike(pattern, escape='\\')
+    )).subquery('hits')
+    page = paginate(db.session.query(hits), (hits.c.start_date, hits.c.id),
+                    after=request.args.get('after'),
+                    before=request.args.get('before'),
+                    per_page=app.config['ITEMS_PER_PAGE'],
+                    descending=True)
 
     response = {
-        'count': len(search_result),
-        'data': search_result,
+        'count': page.items[0].total if page.items else 0,
+        'data': show_listing_data(page.items),
     }
 
-    return render_template('pages/show.html', results=response, search_term=search_term)
+    return render_template('pages/show.html', results=response, search_term=search_term, page=page)
     
+#  API
+#  ----------------------------------------------------------------
+
+# Read-only JSON API. Listings are keyset-paginated on id. Exports stream
+# every row as CSV or NDJSON from a server-side cursor, so memory stays
+# flat whatever the size of the table; they need an export token.
+
+def api_query(resource):
+    # column-only queries: no entities are hydrated
+    if resource == 'venues':
+        return db.session.query(
+            Venue.id, Venue.name, Venue.city, Venue.state, Venue.address,
+            Venue.phone, Venue.genres, Venue.image_link, Venue.facebook_link,
+            Venue.website, Venue.seeking_talent, Venue.seeking_description,
+            Venue.upcoming_shows_count, Venue.past_shows_count
+        ), Venue.id
+    if resource == 'artists':
+        return db.session.query(
+            Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone,
+            Artist.genres, Artist.image_link, Artist.facebook_link,
+            Artist.website, Artist.seeking_venue, Artist.seeking_description,
+            Artist.upcoming_shows_count, Artist.past_shows_count
+        ), Artist.id
+    return db.session.query(
+        Show.id, Show.start_date,
+        Show.venue_id, Venue.name.label('venue_name'),
+        Show.artist_id, Artist.name.label('artist_name')
+    ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id), Show.id
+
+
+def export_rows(resource, after_id=None, batch_size=None):
+    query, key = api_query(resource)
+    if after_id is not None:
+        query = query.filter(key > after_id)
+    return query.order_by(key).yield_per(batch_size or app.config['EXPORT_BATCH_SIZE'])
+
+
+def export_authorized():
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return False
+    return any(hmac.compare_digest(token, allowed) for allowed in app.config['EXPORT_TOKENS'])
+
+
+@app.route('/api/v1/<any(venues, artists, shows):resource>')
+def api_list(resource):
+    query, key = api_query(resource)
+    per_page = min(request.args.get('limit', app.config['ITEMS_PER_PAGE'], type=int),
+                   app.config['API_MAX_PAGE_SIZE'])
+    page = paginate(query, (key,),
+                    after=request.args.get('after'),
+                    before=request.args.get('before'),
+                    per_page=max(per_page, 1))
+
+    return jsonify({
+        'data': [exporter.record(row) for row in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+
+@app.route('/api/v1/<any(venues, artists, shows):resource>/export')
+def api_export(resource):
+    if not export_authorized():
+        return Response('An export token is required.\n', 401,
+                        {'WWW-Authenticate': 'Bearer realm="export"'}, mimetype='text/plain')
+    file_format = request.args.get('format', 'ndjson')
+    if file_format not in exporter.FORMATS:
+        abort(400)
+    # resume an interrupted download from the last id received
+    after_id = request.args.get('after_id', type=int)
+    batch_size = app.config['EXPORT_BATCH_SIZE']
+
+    stream = exporter.ExportStream(export_rows(resource, after_id, batch_size),
+                                   file_format, batch_size)
+    filename = f'{resource}.{file_format}'
+    return Response(stream_with_context(iter(stream)), mimetype=exporter.MIMETYPES[file_format],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@app.cli.command('export')
+@click.argument('resource', type=click.Choice(['venues', 'artists', 'shows']))
+@click.option('--format', 'file_format', type=click.Choice(exporter.FORMATS), default='ndjson',
+              show_default=True)
+@click.option('--output', '-o', default='-', help='File to write (default: stdout).')
+@click.option('--after-id', type=int, help='Resume after this id.')
+@click.option('--batch-size', type=int, help='Rows per round trip and write (default: EXPORT_BATCH_SIZE).')
+def export_command(resource, file_format, output, after_id, batch_size):
+    """Stream venues, artists or shows as CSV or NDJSON."""
+    batch_size = batch_size or app.config['EXPORT_BATCH_SIZE']
+    # a resumed CSV export is appended to the file it started, without a second header
+    resuming = after_id is not None and output != '-'
+    stream = exporter.ExportStream(export_rows(resource, after_id, batch_size),
+                                   file_format, batch_size, header=not resuming)
+    with click.open_file(output, 'a' if resuming else 'w', encoding='utf-8') as f:
+        try:
+            for chunk in stream:
+                f.write(chunk)
+        finally:
+            if stream.last_id is not None:
+                print(f'Exported {stream.count} {resource}, last id {stream.last_id}.', file=sys.stderr)
+            else:
+                print(f'Exported 0 {resource}.', file=sys.stderr)
+
+
 #----------------------------------------------------------------------------#
 # Handle Error Pages.
 #----------------------------------------------------------------------------#
@@ -739,6 +1703,22 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
+# No free database connection within the pool timeout, or a statement
+# cancelled for running too long: tell the client to retry rather than
+# keep a worker waiting.
+@app.errorhandler(PoolTimeoutError)
+def database_busy_error(error):
+    db.session.rollback()
+    return render_template('errors/503.html'), 503, {'Retry-After': '5'}
+
+
+@app.errorhandler(OperationalError)
+def operational_error(error):
+    if not timeouts.is_statement_timeout(error):
+        raise error
+    return database_busy_error(error)
+
+
 if not app.debug:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
@@ -750,6 +1730,11 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+# Load every template now, from the bytecode cache when it is fresh, so
+# the first requests of a new worker do not compile them.
+if app.config.get('TEMPLATE_WARMUP'):
+    templating.warm_templates(app)
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
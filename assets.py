@@ -0,0 +1,176 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+
+from flask import abort, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # .br variants are skipped without it
+    brotli = None
+
+
+# Static asset bundles.
+# `flask assets` concatenates and minifies the files of each bundle into
+# static/dist/<name>.<content hash>.<ext>, next to a .gz and (with the
+# brotli package) a .br copy, and records the names in manifest.json.
+# Templates link them with asset_url('site.css'); since a name changes
+# whenever its content does, they are served with a far-future immutable
+# Cache-Control, picking the precompressed copy the client accepts.
+
+BUNDLES = {
+    'site.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    # loaded in <head>, before the page renders
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    # deferred, at the end of <body>
+    'site.js': [
+        'js/libs/jquery-1.11.1.min.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+        'js/script.js',
+    ],
+    'respond.js': [
+        'js/libs/respond-1.4.2.min.js',
+    ],
+}
+
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+# (Accept-Encoding token, file suffix), in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def minify_css(source):
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    # no space around punctuation; ':' is left alone, since a space before
+    # it is significant in selectors (`a :hover`)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source):
+    # Conservative: drops indentation, blank lines and whole-line comments
+    # only, which cannot change what the script does.
+    lines = []
+    for line in source.splitlines():
+        line = line.strip()
+        if line and not line.startswith('//'):
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def bundle_source(static_folder, name):
+    parts = []
+    for path in BUNDLES[name]:
+        with open(os.path.join(static_folder, path), encoding='utf-8') as f:
+            source = f.read()
+        # source maps point at the original file, not the bundle
+        source = re.sub(r'^\s*//[#@] sourceMappingURL=.*$', '', source, flags=re.M)
+        if '.min.' not in path:
+            source = minify_css(source) if name.endswith('.css') else minify_js(source)
+        parts.append(source.strip())
+    if name.endswith('.js'):
+        # a file that does not end its last statement must not run into the next
+        return ';\n'.join(parts) + ';\n'
+    return '\n'.join(parts) + '\n'
+
+
+def write_file(path, data):
+    # through a temporary file, so a worker never serves a partial one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(static_folder):
+    """Build every bundle and write the manifest; returns the manifest."""
+    directory = os.path.join(static_folder, BUILD_DIR)
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+    for name in BUNDLES:
+        data = bundle_source(static_folder, name).encode('utf-8')
+        stem, ext = os.path.splitext(name)
+        filename = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        path = os.path.join(directory, filename)
+        write_file(path, data)
+        # mtime=0 keeps the .gz identical across builds
+        write_file(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            write_file(path + '.br', brotli.compress(data, quality=11))
+        manifest[name] = filename
+    write_file(os.path.join(directory, MANIFEST), json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, BUILD_DIR, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_stale(static_folder):
+    # whether any source file changed since the manifest was written
+    try:
+        built = os.path.getmtime(os.path.join(static_folder, BUILD_DIR, MANIFEST))
+    except OSError:
+        return True
+    return any(os.path.getmtime(os.path.join(static_folder, path)) > built
+               for paths in BUNDLES.values() for path in paths)
+
+
+class Assets(object):
+
+    def __init__(self):
+        self.static_folder = None
+        self.manifest = {}
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        manifest = load_manifest(self.static_folder)
+        if app.config.get('ASSETS_AUTO_BUILD') and (manifest is None or is_stale(self.static_folder)):
+            manifest = build(self.static_folder)
+        self.manifest = manifest or {}
+        app.add_url_rule(f'{app.static_url_path}/{BUILD_DIR}/<path:filename>', 'asset', self.serve)
+        app.jinja_env.globals['asset_url'] = self.url
+
+    def url(self, name):
+        if name not in self.manifest:
+            raise KeyError(f'No built asset named {name!r}; run `flask assets`')
+        return url_for('asset', filename=self.manifest[name])
+
+    def serve(self, filename):
+        directory = os.path.join(self.static_folder, BUILD_DIR)
+        if filename == MANIFEST or not os.path.isfile(os.path.join(directory, filename)):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        for encoding, suffix in ENCODINGS:
+            if request.accept_encodings[encoding] and os.path.isfile(os.path.join(directory, filename + suffix)):
+                response = send_from_directory(directory, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(directory, filename, mimetype=mimetype)
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+pipeline = Assets()
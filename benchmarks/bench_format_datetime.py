@@ -0,0 +1,69 @@
+"""Microbenchmark for show start time formatting.
+
+Compares the previous chain used on every show row (stringify the
+datetime, re-parse it with dateutil, format it with babel in the view,
+then parse and format the result again in the `datetime` filter) with
+formatting.format_datetime.
+
+    python benchmarks/bench_format_datetime.py [--rows N] [--distinct N]
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import formatting  # noqa: E402
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def legacy_row(start_date):
+    # view: format_datetime(str(show.start_date)), template: |datetime('full')
+    return legacy_format_datetime(legacy_format_datetime(str(start_date)), 'full')
+
+
+def current_row(start_date):
+    return formatting.format_datetime(start_date, 'full')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000, help='show rows per listing')
+    parser.add_argument('--distinct', type=int, default=2000, help='distinct start times')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    start = datetime(2030, 5, 21, 21, 30)
+    dates = [start + timedelta(hours=7 * (i % args.distinct)) for i in range(args.rows)]
+
+    # the new path must produce what the old one rendered for a datetime
+    for value in dates[:50]:
+        expected = legacy_format_datetime(str(value), 'full')
+        assert current_row(value) == expected, (value, current_row(value), expected)
+
+    legacy = min(timeit.repeat(lambda: [legacy_row(d) for d in dates], number=1, repeat=args.repeat))
+    formatting.format_cached.cache_clear()
+    cold = timeit.timeit(lambda: [current_row(d) for d in dates], number=1)
+    warm = min(timeit.repeat(lambda: [current_row(d) for d in dates], number=1, repeat=args.repeat))
+
+    print(f'{args.rows} rows, {args.distinct} distinct start times')
+    print(f'legacy parse/format chain: {legacy * 1000:9.1f} ms')
+    print(f'formatting (cold cache):   {cold * 1000:9.1f} ms  ({legacy / cold:6.1f}x)')
+    print(f'formatting (warm cache):   {warm * 1000:9.1f} ms  ({legacy / warm:6.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
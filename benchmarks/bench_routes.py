@@ -0,0 +1,251 @@
+"""Benchmark the read routes against seeded databases and gate regressions.
+
+For each dataset size, the benchmark database is rebuilt and filled
+with `flask seed`. Every read route is then requested through the Flask
+test client, with the page cache disabled, and measured for:
+- latency (median and p95 over --repeat requests);
+- SQL statements per request;
+- peak Python memory allocated while serving one request (tracemalloc).
+
+The results are compared with benchmarks/baselines.json. The run fails
+(exit status 1) when a route issues more statements than its baseline,
+or when its median latency or peak memory grows past the tolerance. It
+also fails when a route issues a different number of statements on two
+of the sizes run: the listings are built from a fixed number of queries
+however many rows there are, and one growing with the data is an N+1.
+Finally, the paged listings' Next links must carry every filter of the
+first page (sizes too small to have a second page skip this).
+Latencies depend on the machine, so record baselines on the machine
+that runs the gate:
+
+    python benchmarks/bench_routes.py [--sizes small,medium] [--update-baselines]
+
+The database is dropped and recreated for every size. It defaults to a
+SQLite file in the temporary directory; pass --database to benchmark
+PostgreSQL, and never point it at a database you want to keep.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from html import unescape
+from urllib.parse import parse_qs, quote_plus, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(ROOT, 'benchmarks', 'baselines.json')
+sys.path.insert(0, ROOT)
+
+# (venues, artists, shows)
+SIZES = {
+    'tiny': (5, 5, 10),
+    'small': (200, 1000, 10000),
+    'medium': (1000, 5000, 100000),
+    'large': (10000, 50000, 1000000),
+}
+
+ROUTES = [
+    # (name, method, url, form data)
+    ('venues', 'GET', '/venues', None),
+    ('venues_seeking', 'GET', '/venues?seeking=1', None),
+    ('venue', 'GET', '/venues/{venue_id}', None),
+    ('artists', 'GET', '/artists', None),
+    ('artist', 'GET', '/artists/{artist_id}', None),
+    ('shows', 'GET', '/shows', None),
+    ('shows_venue', 'GET', '/shows?from=2000-01-01&venue={venue_id}', None),
+    ('shows_calendar', 'GET', '/shows/calendar', None),
+    ('search_venues', 'POST', '/venues/search', {'search_term': 'Hall'}),
+    ('search_artists', 'POST', '/artists/search', {'search_term': 'band'}),
+    ('search_shows', 'POST', '/shows/search', {'search_term': 'Owl'}),
+]
+
+# filtered listings whose second page must keep the filters
+PAGED_ROUTES = [
+    ('artists_paged', '/artists?genre={genre}&seeking=1'),
+    ('shows_paged', '/shows?from=2000-01-01&venue={venue_id}'),
+]
+
+
+def reset_database(app, db, size):
+    venues, artists, shows = SIZES[size]
+    with app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        db.drop_all()
+        db.create_all()
+    runner = app.test_cli_runner()
+    for args in (['seed', '--venues', str(venues), '--artists', str(artists), '--shows', str(shows)],
+                 ['search-index']):
+        result = runner.invoke(args=args)
+        if result.exit_code != 0:
+            sys.exit(f'flask {args[0]} failed:\n{result.output}{result.exception or ""}')
+
+
+def hottest_ids(db, Show):
+    # the venue and artist with the most shows: the slowest detail pages
+    ids = []
+    for column in (Show.venue_id, Show.artist_id):
+        ids.append(db.session.query(column).group_by(column)
+                   .order_by(db.func.count().desc(), column).limit(1).scalar())
+    return {'venue_id': ids[0], 'artist_id': ids[1]}
+
+
+def sample_genre(Artist):
+    artist = Artist.query.filter(Artist.seeking_venue.is_(True)).order_by(Artist.id).first()
+    return quote_plus(artist.genres[0]) if artist is not None and artist.genres else 'Jazz'
+
+
+def capture_statements(client, db, method, url, data=None):
+    """Request `url`, returning the (statement, parameters) pairs it ran."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    db.event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.open(url, method=method, data=data)
+    finally:
+        db.event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    if response.status_code != 200:
+        sys.exit(f'{method} {url} returned {response.status_code}')
+    return statements
+
+
+def measure(client, db, method, url, data, repeat):
+    capture_statements(client, db, method, url, data)  # warm up templates and caches
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        statements = capture_statements(client, db, method, url, data)
+        timings.append(time.perf_counter() - started)
+    queries = len(statements)
+
+    tracemalloc.start()
+    try:
+        capture_statements(client, db, method, url, data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'p50_ms': round(statistics.median(timings) * 1000, 2),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 2),
+        'queries': queries,
+        'peak_kib': round(peak / 1024),
+    }
+
+
+def pager_problems(client, url):
+    """Compare page 1's query string with its Next link's; None without one."""
+    html = client.get(url).get_data(as_text=True)
+    match = re.search(r'<li class="next"><a href="([^"]+)"', html)
+    if match is None:
+        return None
+    next_url = unescape(match.group(1))
+    expected, found = parse_qs(urlsplit(url).query), parse_qs(urlsplit(next_url).query)
+    problems = [f'{key}={found.get(key)}, page 1 has {values}'
+                for key, values in expected.items() if found.get(key) != values]
+    status = client.get(next_url).status_code
+    if status != 200:
+        problems.append(f'page 2 returned {status}')
+    return problems
+
+
+def regressions(result, baseline, args):
+    problems = []
+    if result['queries'] > baseline['queries']:
+        problems.append(f"queries {baseline['queries']} -> {result['queries']}")
+    limit = baseline['p50_ms'] * (1 + args.latency_tolerance) + args.latency_slack_ms
+    if result['p50_ms'] > limit:
+        problems.append(f"p50 {baseline['p50_ms']} -> {result['p50_ms']} ms")
+    if result['peak_kib'] > baseline['peak_kib'] * (1 + args.memory_tolerance):
+        problems.append(f"peak memory {baseline['peak_kib']} -> {result['peak_kib']} KiB")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='tiny,small,medium',
+                        help='comma separated, from: ' + ', '.join(SIZES))
+    parser.add_argument('--database', default='sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur-bench.db'),
+                        help='database URL to rebuild for every size')
+    parser.add_argument('--repeat', type=int, default=20, help='timed requests per route')
+    parser.add_argument('--latency-tolerance', type=float, default=0.5,
+                        help='allowed median latency growth (0.5 = 50%%)')
+    parser.add_argument('--latency-slack-ms', type=float, default=5.0,
+                        help='allowed absolute latency growth, for very fast routes')
+    parser.add_argument('--memory-tolerance', type=float, default=0.25,
+                        help='allowed peak memory growth')
+    parser.add_argument('--update-baselines', action='store_true',
+                        help='write the results to benchmarks/baselines.json instead of comparing')
+    args = parser.parse_args()
+    sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error('unknown size: ' + ', '.join(unknown))
+
+    # the app reads these at import time
+    os.environ['DATABASE_URL'] = args.database
+    os.environ['FYYUR_PAGE_CACHE'] = 'null'
+    from app import app, db, Artist, Show
+
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+    else:
+        baselines = {}
+
+    failures = 0
+    queries = {}
+    for size in sizes:
+        print(f'{size}: seeding {SIZES[size][0]} venues, {SIZES[size][1]} artists, {SIZES[size][2]} shows')
+        reset_database(app, db, size)
+        with app.app_context():
+            ids = dict(hottest_ids(db, Show), genre=sample_genre(Artist))
+            client = app.test_client()
+            results = {}
+            for name, method, url, data in ROUTES:
+                result = measure(client, db, method, url.format(**ids), data, args.repeat)
+                results[name] = result
+                queries.setdefault(name, []).append(result['queries'])
+                baseline = baselines.get(size, {}).get(name)
+                problems = regressions(result, baseline, args) if baseline and not args.update_baselines else []
+                status = 'FAIL' if problems else ('new ' if baseline is None else 'ok  ')
+                failures += bool(problems)
+                print(f"  {status} {name:15} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+                      f"{result['queries']:3d} queries  {result['peak_kib']:7d} KiB"
+                      + (('  (' + '; '.join(problems) + ')') if problems else ''))
+            for name, url in PAGED_ROUTES:
+                problems = pager_problems(client, url.format(**ids))
+                if problems is None:
+                    print(f'  skip {name:15} no second page')
+                    continue
+                failures += bool(problems)
+                print(f"  {'FAIL' if problems else 'ok  '} {name:15} page 2 keeps the filters"
+                      + (('  (' + '; '.join(problems) + ')') if problems else ''))
+        if args.update_baselines:
+            baselines[size] = results
+
+    for name, counts in queries.items():
+        if len(set(counts)) > 1:
+            failures += 1
+            print(f'  FAIL {name:15} statements per size: '
+                  + ', '.join(f'{size} {count}' for size, count in zip(sizes, counts)))
+
+    if args.update_baselines:
+        with open(BASELINES, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baselines written to {os.path.relpath(BASELINES, ROOT)}.')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
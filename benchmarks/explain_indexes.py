@@ -0,0 +1,89 @@
+"""Check that the read views' queries are served by the secondary indexes.
+
+Every view below is requested through the Flask test client against the
+configured database (DATABASE_URL). The SQL it issues is captured and
+run again under EXPLAIN (EXPLAIN QUERY PLAN on SQLite); the check fails
+when none of a view's plans mentions the index the view relies on.
+
+On PostgreSQL, sequential scans are disabled for the EXPLAIN session so
+small development databases report whether an index *can* be used
+rather than whether the planner prefers it for a few rows.
+
+    DATABASE_URL=postgresql://... python benchmarks/explain_indexes.py
+"""
+import os
+import sys
+from urllib.parse import urlencode
+
+os.environ.setdefault('FYYUR_PAGE_CACHE', 'null')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db, Show, Venue  # noqa: E402
+from bench_routes import capture_statements  # noqa: E402
+
+
+def sample_ids():
+    show = Show.query.order_by(Show.id).first()
+    if show is None:
+        sys.exit('The database has no shows; seed it before checking plans.')
+    return show.venue_id, show.artist_id
+
+
+def sample_area():
+    venue = Venue.query.order_by(Venue.id).first()
+    return venue.city, venue.state
+
+
+def view_checks(dialect_name):
+    venue_id, artist_id = sample_ids()
+    city, state = sample_area()
+    # the unfiltered directory reads area_summary in primary key order
+    area_key = 'area_summary_pkey' if dialect_name == 'postgresql' else 'sqlite_autoindex_area_summary_1'
+    checks = [
+        # (url, index expected in one of the view's plans)
+        ('/venues', area_key),
+        ('/venues?' + urlencode({'state': state, 'city': city}), 'ix_venues_city_state'),
+        (f'/venues/{venue_id}', 'ix_shows_venue_id_start_date'),
+        (f'/artists/{artist_id}', 'ix_shows_artist_id_start_date'),
+        ('/shows', 'ix_shows_start_date'),
+    ]
+    if dialect_name == 'postgresql':
+        # SQLite keeps genres as JSON, with no index to use
+        checks += [
+            ('/venues?genre=Jazz', 'ix_venues_genres'),
+            ('/artists?genre=Jazz', 'ix_artists_genres'),
+        ]
+    return checks
+
+
+def explain(connection, statement, parameters):
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+    else:
+        rows = connection.exec_driver_sql('EXPLAIN ' + statement, parameters)
+    return '\n'.join(' '.join(str(column) for column in row) for row in rows)
+
+
+def main():
+    failures = 0
+    with app.app_context():
+        client = app.test_client()
+        checks = view_checks(db.engine.dialect.name)
+        with db.engine.connect() as connection:
+            if connection.dialect.name == 'postgresql':
+                connection.exec_driver_sql('SET enable_seqscan = off')
+            for url, index in checks:
+                plans = [explain(connection, statement, parameters)
+                         for statement, parameters in capture_statements(client, db, 'GET', url)]
+                if any(index in plan for plan in plans):
+                    print(f'ok    {url}: {index}')
+                else:
+                    failures += 1
+                    print(f'FAIL  {url}: no plan uses {index}')
+                    for plan in plans:
+                        print('      ' + plan.replace('\n', '\n      '))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import g, make_response, request, session
+from werkzeug.http import is_resource_modified
+
+
+# Rendered page cache.
+# Backends share a tiny get/set/delete interface so views can be cached
+# in-process (LRUCache) or in a directory shared by every worker on the
+# host (FileSystemCache). Entries are removed explicitly by the write
+# handlers, which only reaches the writer's own LRUCache, so that one is
+# for single-process servers; the timeout only bounds how stale an entry
+# missed by an out-of-process writer can get.
+
+class CacheStats(object):
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # callables run with the event name ('hits', 'misses', 'evictions')
+        self.listeners = []
+
+    def count(self, event):
+        setattr(self, event, getattr(self, event) + 1)
+        for listener in self.listeners:
+            listener(event)
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class NullCache(object):
+    """Cache that stores nothing; used when page caching is disabled."""
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    def get(self, key):
+        self.stats.count('misses')
+        return None
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def delete_many(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def info(self):
+        return dict(self.stats.as_dict(), backend='null')
+
+
+class LRUCache(object):
+    """In-process cache bounded by the total size of its values in bytes.
+
+    The least recently used entries are evicted once `max_bytes` is
+    exceeded. Values are expected to be `str` or `bytes`.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, default_timeout=300):
+        self.max_bytes = max_bytes
+        self.default_timeout = default_timeout
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.stats.count('misses')
+                return None
+            self._entries.move_to_end(key)
+            self.stats.count('hits')
+            return entry[0]
+
+    def set(self, key, value, timeout=None):
+        size = len(value.encode('utf-8')) if isinstance(value, str) else len(value)
+        if size > self.max_bytes:
+            return
+        expires = time.time() + (timeout or self.default_timeout)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats.count('evictions')
+
+    def delete_many(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def info(self):
+        return dict(self.stats.as_dict(), backend='lru',
+                    entries=len(self._entries), bytes=self._size,
+                    max_bytes=self.max_bytes)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[2]
+
+
+class FileSystemCache(object):
+    """Cache stored as one file per entry, shared by all worker processes.
+
+    Writes go through a temporary file and an atomic rename, so readers
+    never see a partial entry. Reads refresh the file's mtime; when the
+    directory grows past `max_bytes`, the least recently read files are
+    pruned (checked every `prune_interval` writes of this process).
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, default_timeout=300,
+                 prune_interval=64):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_timeout = default_timeout
+        self.prune_interval = prune_interval
+        self.stats = CacheStats()
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.stats.count('misses')
+            return None
+        if expires < time.time():
+            self._unlink(path)
+            self.stats.count('misses')
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.stats.count('hits')
+        return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + (timeout or self.default_timeout)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            self._unlink(tmp_path)
+            return
+        self._writes += 1
+        if self._writes % self.prune_interval == 0:
+            self.prune()
+
+    def delete_many(self, *keys):
+        for key in keys:
+            self._unlink(self._path(key))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            self._unlink(os.path.join(self.directory, name))
+
+    def prune(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._unlink(path)
+            total -= size
+            self.stats.count('evictions')
+
+    def info(self):
+        return dict(self.stats.as_dict(), backend='filesystem',
+                    directory=self.directory, max_bytes=self.max_bytes)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def create_cache(config, prefix='PAGE_CACHE'):
+    # reads <prefix>_TYPE, _DIR, _MAX_BYTES and _TIMEOUT from config
+    backend = config.get(f'{prefix}_TYPE', 'null')
+    timeout = config.get(f'{prefix}_TIMEOUT', 300)
+    if backend == 'lru':
+        return LRUCache(config.get(f'{prefix}_MAX_BYTES', 64 * 1024 * 1024), timeout)
+    if backend == 'filesystem':
+        return FileSystemCache(config[f'{prefix}_DIR'],
+                               config.get(f'{prefix}_MAX_BYTES', 256 * 1024 * 1024), timeout)
+    return NullCache()
+
+
+def cached_page(cache, key_format):
+    """Cache the HTML returned by a view under `key_format.format(**view_args)`.
+
+    Requests with a query string or pending flash messages bypass the
+    cache, since their output is not shared between visitors. Under
+    conditional_get, entries are stamped with the ETag they were rendered
+    for, and one with another ETag is treated as a miss: a body cached
+    before a write (by a request racing it, from a lagging replica, by
+    another host or before a template change) is never sent with, and
+    then kept under, a newer ETag.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if request.args or '_flashes' in session:
+                return view(**kwargs)
+            key = key_format.format(**kwargs)
+            stamp = g.get('page_etag') or ''
+            entry = cache.get(key)
+            if entry is not None:
+                entry_stamp, _, html = entry.partition(':')
+                if entry_stamp == stamp:
+                    return html
+            html = view(**kwargs)
+            if isinstance(html, str):
+                cache.set(key, stamp + ':' + html)
+            return html
+        return wrapper
+    return decorator
+
+
+def conditional_get(validator, version=''):
+    """Answer 304 Not Modified when the client's copy of a page is current.
+
+    `validator(**view_args)` returns a tuple of values that change whenever
+    the page's content does, or None if there is nothing to validate (the
+    view then runs as usual, e.g. to 404). The ETag is a hash of those
+    values, the request path and `version`. No Last-Modified is sent: the
+    values include row counts and the clock, which a date can't capture
+    (a deleted row leaves the newest updated_at as it was), so
+    If-Modified-Since alone never gets a 304. Pages with pending flash
+    messages are always rendered.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if '_flashes' in session:
+                return view(**kwargs)
+            validated = validator(**kwargs)
+            if validated is None:
+                return view(**kwargs)
+            etag = hashlib.sha1(repr((version, request.full_path, validated)).encode('utf-8')).hexdigest()
+            if not is_resource_modified(request.environ, etag=etag):
+                response = make_response('', 304)
+            else:
+                # for cached_page to stamp (and check) its entry with
+                g.page_etag = etag
+                response = make_response(view(**kwargs))
+            response.set_etag(etag)
+            # browsers may keep the page, but must revalidate it on every use
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,165 @@
+import time
+import zlib
+
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:  # gzip only without it
+    brotli = None
+
+
+# Response compression, as WSGI middleware around the Flask app.
+# Text responses (HTML, JSON, NDJSON, CSV) are compressed with brotli or
+# gzip, whichever the client prefers among those it accepts, as they are
+# written: each chunk the app yields is compressed and flushed on its
+# own, so streamed exports go out as they are produced and are never held
+# in memory whole. Responses that are small, already encoded (the
+# precompressed static bundles) or bodiless (304) pass through untouched.
+
+COMPRESSIBLE_TYPES = (
+    'text/html', 'text/plain', 'text/csv', 'text/css', 'text/javascript',
+    'application/json', 'application/x-ndjson', 'application/javascript',
+)
+
+
+class GzipStream(object):
+
+    def __init__(self, level):
+        # wbits 16 + MAX_WBITS: gzip header and trailer around the deflate stream
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk):
+        return self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliStream(object):
+
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, chunk):
+        return self.compressor.process(chunk) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class CompressionMiddleware(object):
+
+    def __init__(self, wsgi_app, level=6, brotli_quality=4, min_size=500):
+        self.wsgi_app = wsgi_app
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.min_size = min_size
+        # callables run with (encoding, bytes in, bytes out, CPU seconds)
+        # once a compressed response has been written
+        self.listeners = []
+
+    def choose_encoding(self, environ):
+        if environ.get('REQUEST_METHOD') == 'HEAD' or 'HTTP_RANGE' in environ:
+            return None
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        # ties go to brotli, which compresses text better
+        if brotli is not None and accepted['br'] and accepted['br'] >= accepted['gzip']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def should_compress(self, status, headers):
+        if not status.startswith('200'):
+            return False
+        names = {name.lower(): value for name, value in headers}
+        if 'content-encoding' in names or 'no-transform' in names.get('cache-control', ''):
+            return False
+        length = names.get('content-length')
+        if length is not None and int(length) < self.min_size:
+            return False
+        return is_compressible(names.get('content-type', ''))
+
+    def __call__(self, environ, start_response):
+        encoding = self.choose_encoding(environ)
+        state = {}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            if is_compressible(header_value(headers, 'Content-Type')):
+                headers = add_vary(headers)
+            if encoding is not None and self.should_compress(status, headers):
+                state['encoding'] = encoding
+                etag = header_value(headers, 'ETag')
+                headers = [(name, value) for name, value in headers
+                           if name.lower() not in ('content-length', 'etag')]
+                headers.append(('Content-Encoding', encoding))
+                if etag:
+                    # the compressed body is only equivalent to the original,
+                    # which a weak validator still lets conditional GETs match
+                    headers.append(('ETag', etag if etag.startswith('W/') else 'W/' + etag))
+            return start_response(status, headers, exc_info)
+
+        body = self.wsgi_app(environ, compressing_start_response)
+        if 'encoding' not in state:
+            return body
+        return self.compress(body, state['encoding'])
+
+    def compress(self, body, encoding):
+        stream = BrotliStream(self.brotli_quality) if encoding == 'br' else GzipStream(self.level)
+        bytes_in = bytes_out = 0
+        cpu = 0.0
+        try:
+            for chunk in body:
+                if not chunk:
+                    continue
+                started = time.thread_time()
+                data = stream.compress(chunk)
+                cpu += time.thread_time() - started
+                bytes_in += len(chunk)
+                bytes_out += len(data)
+                if data:
+                    yield data
+            started = time.thread_time()
+            data = stream.finish()
+            cpu += time.thread_time() - started
+            bytes_out += len(data)
+            yield data
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        for listener in self.listeners:
+            listener(encoding, bytes_in, bytes_out, cpu)
+
+
+def is_compressible(content_type):
+    return content_type.split(';')[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+def header_value(headers, name):
+    for key, value in headers:
+        if key.lower() == name.lower():
+            return value
+    return ''
+
+
+def add_vary(headers):
+    # the body depends on Accept-Encoding even when it is sent as is
+    for index, (name, value) in enumerate(headers):
+        if name.lower() == 'vary':
+            if 'accept-encoding' not in value.lower():
+                headers = list(headers)
+                headers[index] = (name, value + ', Accept-Encoding')
+            return headers
+    return list(headers) + [('Vary', 'Accept-Encoding')]
+
+
+def init_app(app):
+    middleware = CompressionMiddleware(
+        app.wsgi_app,
+        level=app.config.get('COMPRESSION_LEVEL', 6),
+        brotli_quality=app.config.get('COMPRESSION_BROTLI_QUALITY', 4),
+        min_size=app.config.get('COMPRESSION_MIN_SIZE', 500))
+    app.wsgi_app = middleware
+    app.extensions['compression'] = middleware
+    return middleware
@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+
+# Streaming export of query rows as CSV or NDJSON.
+# Rows are consumed from a server-side cursor and written out in chunks
+# of `batch_size` rows, so memory is bounded by one batch whatever the
+# size of the table. ExportStream remembers the last id it wrote, which
+# is where an interrupted export resumes from.
+
+FORMATS = ('csv', 'ndjson')
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def record(row):
+    """Return a query row as a JSON-serializable dict."""
+    data = row._asdict()
+    for key, value in data.items():
+        if isinstance(value, datetime):
+            data[key] = value.isoformat()
+    return data
+
+
+class ExportStream(object):
+
+    def __init__(self, rows, file_format='ndjson', batch_size=1000, header=True):
+        self.rows = rows
+        self.file_format = file_format
+        self.batch_size = batch_size
+        self.header = header
+        self.last_id = None
+        self.count = 0
+
+    def __iter__(self):
+        buffer = io.StringIO()
+        writer = None
+        pending = 0
+        for row in self.rows:
+            if self.file_format == 'csv':
+                if writer is None:
+                    writer = csv.writer(buffer)
+                    if self.header:
+                        writer.writerow(row._fields)
+                writer.writerow([csv_value(value) for value in row])
+            else:
+                buffer.write(json.dumps(record(row)))
+                buffer.write('\n')
+            self.last_id = row.id
+            self.count += 1
+            pending += 1
+            if pending == self.batch_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+def csv_value(value):
+    if isinstance(value, (list, tuple)):
+        # the importer reads JSON lists back
+        return json.dumps(list(value))
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    return value
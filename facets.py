@@ -0,0 +1,35 @@
+from sqlalchemy import String, and_, cast, exists, func, select
+from sqlalchemy.dialects import postgresql
+
+
+# Genre filters and facet counts for the venue and artist directories.
+# On PostgreSQL, genres is a varchar[] column: containment (@>) is answered
+# by the GIN index on it, and unnest() spreads rows over their genres to
+# count them. SQLite stores genres as JSON and uses json_each() for both.
+
+def genre_values(column, dialect_name):
+    """A table of the genres of each row of `column`'s table, one per row."""
+    if dialect_name == 'postgresql':
+        return func.unnest(column).table_valued('value', joins_implicitly=True).render_derived(name='genre')
+    return func.json_each(column).table_valued('value', joins_implicitly=True).alias('genre')
+
+
+def has_genres(column, genres, dialect_name):
+    """Criterion for rows listing every one of `genres`."""
+    if dialect_name == 'postgresql':
+        # cast, since varchar[] @> text[] has no operator
+        return column.op('@>')(cast(postgresql.array(list(genres)), postgresql.ARRAY(String)))
+    criteria = []
+    for genre in genres:
+        values = func.json_each(column).table_valued('value')
+        criteria.append(exists(select(1).select_from(values).where(values.c.value == genre)))
+    return and_(*criteria)
+
+
+def genre_counts(session, model, criteria, dialect_name):
+    """(genre, number of rows) pairs over the rows matching `criteria`, in one query."""
+    genre = genre_values(model.genres, dialect_name)
+    count = func.count().label('count')
+    return session.query(genre.c.value.label('genre'), count).select_from(model).filter(
+        *criteria
+    ).group_by(genre.c.value).order_by(count.desc(), genre.c.value).all()
@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import dateutil.parser
+from babel import Locale
+from babel.dates import LC_TIME, format_datetime as babel_format_datetime, parse_pattern
+
+
+# Datetime formatting for show listings.
+# Patterns are compiled once, locales are parsed once, and formatted
+# values are memoized on (datetime, format, locale), so a page with many
+# shows at the same few start times formats each distinct time once.
+
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+# babel's own locale-dependent formats, used for any other named format
+BABEL_FORMATS = ('full', 'long', 'medium', 'short')
+
+FORMAT_CACHE_SIZE = 8192
+
+
+@lru_cache(maxsize=None)
+def compiled_pattern(format):
+    return parse_pattern(DATETIME_FORMATS.get(format, format))
+
+
+@lru_cache(maxsize=None)
+def get_locale(locale):
+    return Locale.parse(locale or LC_TIME)
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def format_cached(value, format, locale):
+    if value.tzinfo is None:
+        # babel treats naive datetimes as UTC
+        value = value.replace(tzinfo=timezone.utc)
+    if format in BABEL_FORMATS and format not in DATETIME_FORMATS:
+        return babel_format_datetime(value, format, locale=get_locale(locale))
+    return compiled_pattern(format).apply(value, get_locale(locale))
+
+
+def format_datetime(value, format='medium', locale=None):
+    """Format a datetime (or a string holding one) for display."""
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    return format_cached(value, format, locale)
@@ -0,0 +1,324 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+
+import dateutil.parser
+from sqlalchemy import select
+from werkzeug.datastructures import MultiDict
+from wtforms.validators import DataRequired
+
+from forms import ArtistForm, ShowForm, VenueForm
+
+
+# Bulk import of venues, artists and shows from CSV or JSON lines.
+# Records are validated with the same WTForms forms the create pages
+# use, foreign keys are resolved a batch at a time, and every batch is
+# written with a single COPY (PostgreSQL) or executemany INSERT and
+# committed on its own.
+
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y', 'on')
+
+
+class ImportSpec(object):
+
+    def __init__(self, table_name, form_class, fields, list_fields=(), bool_fields=(),
+                 columns=None, references=()):
+        self.table_name = table_name
+        self.form_class = form_class
+        self.fields = fields
+        self.list_fields = list_fields
+        self.bool_fields = bool_fields
+        # form field -> table column, where the names differ
+        self.columns = columns or {}
+        # (id field, name field, referenced table) triples
+        self.references = references
+
+
+SPECS = {
+    'venues': ImportSpec(
+        'venues', VenueForm,
+        ('name', 'city', 'state', 'address', 'phone', 'genres', 'image_link',
+         'facebook_link', 'website', 'seeking_talent', 'seeking_description'),
+        list_fields=('genres',), bool_fields=('seeking_talent',)),
+    'artists': ImportSpec(
+        'artists', ArtistForm,
+        ('name', 'city', 'state', 'phone', 'genres', 'image_link',
+         'facebook_link', 'website', 'seeking_venue', 'seeking_description'),
+        list_fields=('genres',), bool_fields=('seeking_venue',)),
+    'shows': ImportSpec(
+        'shows', ShowForm,
+        ('artist_id', 'venue_id', 'start_time'),
+        columns={'start_time': 'start_date'},
+        references=(('venue_id', 'venue_name', 'venues'),
+                    ('artist_id', 'artist_name', 'artists'))),
+}
+
+
+class ImportProgress(object):
+
+    def __init__(self, started):
+        self.started = started
+        self.read = 0
+        self.inserted = 0
+        self.rejected = 0
+        # (line number, {field: [messages]}) of the last batch
+        self.errors = []
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.inserted / elapsed if elapsed > 0 else 0.0
+
+
+def read_records(path, format=None):
+    """Yield (line number, record dict) pairs; undecodable lines give None."""
+    if format is None:
+        format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            # line 1 is the header
+            for line_no, record in enumerate(csv.DictReader(f), start=2):
+                yield line_no, record
+        else:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield line_no, record if isinstance(record, dict) else None
+
+
+def run_import(session, metadata, resource, records, batch_size=5000, after_batch=None):
+    """Import `records` into `resource`, yielding an ImportProgress per batch.
+
+    `after_batch(resource, rows)` runs inside each batch's transaction,
+    right after its rows are inserted.
+    """
+    spec = SPECS[resource]
+    table = metadata.tables[spec.table_name]
+    progress = ImportProgress(time.monotonic())
+
+    batch = []
+    for line_no, record in records:
+        batch.append((line_no, record))
+        if len(batch) == batch_size:
+            import_batch(session, table, spec, batch, progress, after_batch)
+            yield progress
+            batch = []
+    if batch:
+        import_batch(session, table, spec, batch, progress, after_batch)
+        yield progress
+
+
+def import_batch(session, table, spec, batch, progress, after_batch):
+    progress.read += len(batch)
+    progress.errors = []
+    resolved = resolve_references(session, table.metadata, spec, batch)
+
+    rows = []
+    now = datetime.now()
+    for line_no, record in batch:
+        if record is None:
+            progress.errors.append((line_no, {'record': ['Not a valid JSON object.']}))
+            continue
+        row, errors = validate_record(spec, record, resolved)
+        if errors:
+            progress.errors.append((line_no, errors))
+            continue
+        if spec.table_name == 'shows':
+            row['upcoming'] = row['start_date'] > now
+        rows.append(row)
+
+    progress.rejected += len(progress.errors)
+    if rows:
+        insert_rows(session, table, rows)
+        if after_batch is not None:
+            after_batch(spec.table_name, rows)
+    session.commit()
+    progress.inserted += len(rows)
+
+
+def validate_record(spec, record, resolved):
+    formdata = MultiDict()
+    for field in spec.fields:
+        value = record.get(field)
+        if field == 'start_time' and value is None:
+            value = record.get('start_date')
+        if field in spec.list_fields:
+            try:
+                items = parse_list(value)
+            except ValueError:
+                return None, {field: ['Not a valid list.']}
+            for item in items:
+                formdata.add(field, item)
+        elif field in spec.bool_fields:
+            if parse_bool(value):
+                formdata.add(field, 'y')
+        elif field == 'start_time' and value:
+            formdata.add(field, normalize_datetime(value))
+        elif value is not None:
+            formdata.add(field, str(value).strip())
+
+    for id_field, name_field, referenced in spec.references:
+        if not formdata.get(id_field) and record.get(name_field):
+            by_name, existing = resolved[referenced]
+            ids = by_name.get(record[name_field], ())
+            if len(ids) == 1:
+                formdata[id_field] = str(ids[0])
+            elif ids:
+                return None, {name_field: ['Matches more than one row.']}
+
+    # no field defaults: a missing value must fail DataRequired like an
+    # empty one, not import e.g. ShowForm's start_time default (the time
+    # forms.py was imported)
+    form = spec.form_class(formdata=formdata, meta={'csrf': False}, **dict.fromkeys(spec.fields))
+    form.validate()
+    # like the create pages, optional fields may be left empty
+    errors = {name: messages for name, messages in form.errors.items()
+              if form[name].data not in (None, '', []) or is_required(form[name])}
+
+    for id_field, name_field, referenced in spec.references:
+        if id_field not in errors:
+            try:
+                by_name, existing = resolved[referenced]
+                if int(form[id_field].data) not in existing:
+                    errors[id_field] = ['No such row in ' + referenced + '.']
+            except ValueError:
+                errors[id_field] = ['Not a valid id.']
+    if errors:
+        return None, errors
+
+    row = {}
+    for field in spec.fields:
+        data = form[field].data
+        row[spec.columns.get(field, field)] = None if data == '' else data
+    for id_field, name_field, referenced in spec.references:
+        row[id_field] = int(row[id_field])
+    return row, None
+
+
+def resolve_references(session, metadata, spec, batch):
+    """Look up the batch's referenced names and ids, at most two queries per table."""
+    resolved = {}
+    for id_field, name_field, referenced in spec.references:
+        table = metadata.tables[referenced]
+        ids, names = set(), set()
+        for line_no, record in batch:
+            if not record:
+                continue
+            value = record.get(id_field)
+            if value not in (None, ''):
+                try:
+                    ids.add(int(value))
+                except (TypeError, ValueError):
+                    pass
+            elif record.get(name_field):
+                names.add(record[name_field])
+
+        by_name = {}
+        if names:
+            for row_id, name in session.execute(
+                    select(table.c.id, table.c.name).where(table.c.name.in_(names))):
+                by_name.setdefault(name, []).append(row_id)
+        existing = {row_id for row_ids in by_name.values() for row_id in row_ids}
+        if ids:
+            existing.update(row_id for row_id, in session.execute(
+                select(table.c.id).where(table.c.id.in_(ids))))
+        resolved[referenced] = (by_name, existing)
+    return resolved
+
+
+def insert_rows(session, table, rows):
+    connection = session.connection()
+    # postgresql:// is psycopg (3) with SQLAlchemy 2.1, psycopg2 before
+    if connection.dialect.driver in ('psycopg', 'psycopg2'):
+        copy_rows(connection.connection, table, rows)
+    else:
+        connection.execute(table.insert(), rows)
+
+
+def copy_rows(dbapi_connection, table, rows):
+    columns = list(rows[0])
+    # COPY bypasses SQLAlchemy, so fill in the Python-side column defaults
+    # (updated_at, ...) that table.insert() would apply; the tables may be
+    # built by create_all(), without the migrations' server defaults
+    defaults = column_defaults(table, columns)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([copy_value(row[column]) for column in columns]
+                        + [copy_value(value) for value in defaults.values()])
+    columns += list(defaults)
+    statement = f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)'
+    cursor = dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, 'copy'):
+            # psycopg 3
+            with cursor.copy(statement) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+    finally:
+        cursor.close()
+
+
+def column_defaults(table, present):
+    # evaluated once per batch, like a server default once per statement
+    defaults = {}
+    for column in table.columns:
+        default = column.default
+        if column.name in present or default is None:
+            continue
+        if default.is_scalar:
+            defaults[column.name] = default.arg
+        elif default.is_callable:
+            defaults[column.name] = default.arg(None)
+    return defaults
+
+
+def copy_value(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (list, tuple)):
+        # PostgreSQL array literal
+        return '{' + ','.join(
+            '"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value) + '}'
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    return value
+
+
+def parse_list(value):
+    if value is None or value == '':
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value]
+    value = str(value).strip()
+    if value.startswith('['):
+        return [str(item) for item in json.loads(value)]
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return value is not None and str(value).strip().lower() in TRUE_VALUES
+
+
+def normalize_datetime(value):
+    # ShowForm expects '%Y-%m-%d %H:%M:%S'; accept ISO 8601 as well
+    try:
+        return dateutil.parser.parse(str(value)).strftime('%Y-%m-%d %H:%M:%S')
+    except (ValueError, OverflowError):
+        return str(value)
+
+
+def is_required(field):
+    return any(isinstance(validator, DataRequired) for validator in field.validators)
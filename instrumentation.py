@@ -0,0 +1,117 @@
+import json
+import logging
+import time
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Per-request timings: SQL statement count and time, template render
+# time and total handler time. They are sent back in a Server-Timing
+# header (shown by the browser's network panel) and logged as one JSON
+# line per request on the 'fyyur.requests' logger. Nothing is hooked up
+# unless init_app() is called.
+
+logger = logging.getLogger('fyyur.requests')
+
+
+class RequestTimings(object):
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self._template_started = None
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'sql;dur={self.sql_time * 1000:.1f};desc="queries: {self.sql_count}"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'app;dur={max(total - self.sql_time - self.template_time, 0) * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def current_timings():
+    if has_request_context():
+        return g.get('timings')
+    return None
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_timings() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = current_timings()
+    started = conn.info.get('query_started')
+    if timings is not None and started:
+        timings.sql_count += 1
+        timings.sql_time += time.perf_counter() - started.pop()
+
+
+def handle_error(context):
+    # a failed statement never reaches after_cursor_execute
+    started = context.connection.info.get('query_started') if context.connection else None
+    if started:
+        started.pop()
+
+
+def template_started(app, template, context, **extra):
+    timings = current_timings()
+    if timings is not None:
+        timings._template_started = time.perf_counter()
+
+
+def template_finished(app, template, context, **extra):
+    timings = current_timings()
+    if timings is not None and timings._template_started is not None:
+        timings.template_time += time.perf_counter() - timings._template_started
+        timings._template_started = None
+
+
+def start_request():
+    g.timings = RequestTimings()
+
+
+def finish_request(response):
+    timings = g.pop('timings', None)
+    if timings is None:
+        return response
+    total = timings.total_time
+    response.headers['Server-Timing'] = timings.server_timing(total)
+    logger.info(json.dumps({
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'sql_count': timings.sql_count,
+        'sql_ms': round(timings.sql_time * 1000, 2),
+        'template_ms': round(timings.template_time * 1000, 2),
+        'total_ms': round(total * 1000, 2),
+    }))
+    return response
+
+
+def init_app(app):
+    # listening on the Engine class covers every engine the app creates
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(Engine, 'handle_error', handle_error)
+    before_render_template.connect(template_started, app)
+    template_rendered.connect(template_finished, app)
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
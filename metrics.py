@@ -0,0 +1,124 @@
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter,
+                               Histogram, generate_latest, multiprocess)
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+# Prometheus metrics served at /metrics: request counts and latency per
+# route and status, database pool checkout time, page cache lookups and
+# the bytes saved and CPU spent by response compression.
+#
+# Under a pre-forking server (gunicorn, uwsgi) set PROMETHEUS_MULTIPROC_DIR
+# to an empty directory before starting it. Every worker then writes its
+# samples to memory-mapped files there and /metrics adds them up across
+# workers, whichever one serves the scrape. Clear the directory between
+# deployments, and call multiprocess.mark_process_dead(pid) from the
+# server's child-exit hook.
+#
+# The cache hit ratio is
+#   sum(rate(fyyur_page_cache_lookups_total{result="hit"}[5m]))
+#     / sum(rate(fyyur_page_cache_lookups_total[5m]))
+# and the compression ratio
+#   sum(rate(fyyur_compression_bytes_total{stage="out"}[5m]))
+#     / sum(rate(fyyur_compression_bytes_total{stage="in"}[5m]))
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 10.0)
+
+REQUESTS = Counter(
+    'fyyur_requests_total', 'HTTP requests handled.',
+    ('method', 'route', 'status'))
+REQUEST_LATENCY = Histogram(
+    'fyyur_request_duration_seconds', 'Time spent handling a request.',
+    ('method', 'route', 'status'), buckets=LATENCY_BUCKETS)
+POOL_CHECKOUT = Histogram(
+    'fyyur_db_pool_checkout_seconds',
+    'Time spent getting a connection from the pool, including waiting for a free one.',
+    buckets=(.0005, .001, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 30.0))
+POOL_TIMEOUTS = Counter(
+    'fyyur_db_pool_timeouts_total', 'Checkouts that gave up waiting for a free connection.')
+CACHE_LOOKUPS = Counter(
+    'fyyur_page_cache_lookups_total', 'Rendered page cache lookups.', ('result',))
+CACHE_EVICTIONS = Counter(
+    'fyyur_page_cache_evictions_total', 'Entries evicted from the page cache to stay under its size limit.')
+COMPRESSED_RESPONSES = Counter(
+    'fyyur_compressed_responses_total', 'Responses compressed on the fly.', ('encoding',))
+COMPRESSION_BYTES = Counter(
+    'fyyur_compression_bytes_total', 'Response body bytes before (in) and after (out) compression.',
+    ('encoding', 'stage'))
+COMPRESSION_SAVED = Counter(
+    'fyyur_compression_bytes_saved_total', 'Response body bytes saved by compression.', ('encoding',))
+COMPRESSION_CPU = Counter(
+    'fyyur_compression_cpu_seconds_total', 'CPU time spent compressing responses.', ('encoding',))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout takes."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            POOL_CHECKOUT.observe(time.perf_counter() - started)
+
+
+def start_request():
+    g.metrics_started = time.perf_counter()
+
+
+def finish_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        # label by URL rule, not path, so ids do not create new series
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = (request.method, route, str(response.status_code))
+        REQUESTS.labels(*labels).inc()
+        REQUEST_LATENCY.labels(*labels).observe(time.perf_counter() - started)
+    return response
+
+
+def count_cache_event(event):
+    if event == 'evictions':
+        CACHE_EVICTIONS.inc()
+    else:
+        CACHE_LOOKUPS.labels('hit' if event == 'hits' else 'miss').inc()
+
+
+def count_compression(encoding, bytes_in, bytes_out, cpu_seconds):
+    COMPRESSED_RESPONSES.labels(encoding).inc()
+    COMPRESSION_BYTES.labels(encoding, 'in').inc(bytes_in)
+    COMPRESSION_BYTES.labels(encoding, 'out').inc(bytes_out)
+    COMPRESSION_SAVED.labels(encoding).inc(max(bytes_in - bytes_out, 0))
+    COMPRESSION_CPU.labels(encoding).inc(cpu_seconds)
+
+
+def metrics_view():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        # file-backed values: collect every worker's samples
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app, page_cache=None):
+    """Collect metrics for `app`; call it before the SQLAlchemy engine is created."""
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    # in-memory SQLite keeps its StaticPool
+    options.setdefault('poolclass', TimedQueuePool)
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    if page_cache is not None:
+        page_cache.stats.listeners.append(count_cache_event)
+    compressor = app.extensions.get('compression')
+    if compressor is not None:
+        compressor.listeners.append(count_compression)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
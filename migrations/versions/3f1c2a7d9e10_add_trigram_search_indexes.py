@@ -0,0 +1,29 @@
+"""add trigram search indexes
+
+Revision ID: 3f1c2a7d9e10
+Revises: 5b675de1cbca
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7d9e10'
+down_revision = '5b675de1cbca'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_venues_name_trgm', 'venues', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_artists_name_trgm', 'artists', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_artists_name_trgm', table_name='artists')
+    op.drop_index('ix_venues_name_trgm', table_name='venues')
@@ -0,0 +1,31 @@
+"""add updated_at
+
+Revision ID: 4e8a1c5b7d29
+Revises: 9d3b7f2a6c18
+Create Date: 2026-10-18 17:05:41.227804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e8a1c5b7d29'
+down_revision = '9d3b7f2a6c18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the server default fills in existing rows, and rows bulk loaded with
+    # COPY (which skips the model's Python-side default)
+    for table in ('venues', 'artists', 'shows'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=sa.text("timezone('utc', now())")))
+        op.create_index(f'ix_{table}_updated_at', table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('shows', 'artists', 'venues'):
+        op.drop_index(f'ix_{table}_updated_at', table_name=table)
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,46 @@
+"""add show counters
+
+Revision ID: 7a4d0c1b2e63
+Revises: 3f1c2a7d9e10
+Create Date: 2026-10-18 10:03:27.540912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4d0c1b2e63'
+down_revision = '3f1c2a7d9e10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('upcoming', sa.Boolean(), server_default=sa.true(), nullable=False))
+    for table in ('venues', 'artists'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+
+    # backfill from the existing shows
+    op.execute('UPDATE shows SET upcoming = start_date > now()')
+    for table, key in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.execute(f'''
+            UPDATE {table} SET
+                upcoming_shows_count = counted.upcoming,
+                past_shows_count = counted.past
+            FROM (
+                SELECT {key} AS owner_id,
+                       count(*) FILTER (WHERE upcoming) AS upcoming,
+                       count(*) FILTER (WHERE NOT upcoming) AS past
+                FROM shows GROUP BY {key}
+            ) AS counted
+            WHERE {table}.id = counted.owner_id
+        ''')
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
+    op.drop_column('shows', 'upcoming')
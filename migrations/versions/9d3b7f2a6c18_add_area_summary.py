@@ -0,0 +1,49 @@
+"""add area summary
+
+Revision ID: 9d3b7f2a6c18
+Revises: c2e8f5a41d07
+Create Date: 2026-10-18 15:42:08.913377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3b7f2a6c18'
+down_revision = 'c2e8f5a41d07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('area_summary',
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('venue_count', sa.Integer(), nullable=False),
+    sa.Column('upcoming_shows_count', sa.Integer(), nullable=False),
+    sa.Column('venues', sa.JSON(), nullable=False),
+    sa.Column('genre_counts', sa.JSON(), nullable=False),
+    sa.PrimaryKeyConstraint('city', 'state')
+    )
+
+    # backfill from the existing venues (same rows as `flask refresh-areas`,
+    # except the venue versions, added by e5c9a2f47b13 once updated_at exists)
+    op.execute('''
+        INSERT INTO area_summary (city, state, venue_count, upcoming_shows_count, venues, genre_counts)
+        SELECT v.city, v.state, count(*), sum(v.upcoming_shows_count),
+               json_agg(json_build_object('id', v.id, 'name', v.name,
+                                          'num_upcoming_shows', v.upcoming_shows_count) ORDER BY v.id),
+               coalesce((SELECT json_object_agg(genre, n) FROM (
+                   SELECT genre, count(*) AS n
+                   FROM venues g, unnest(g.genres) AS genre
+                   WHERE g.city = v.city AND g.state = v.state
+                   GROUP BY genre
+               ) AS counted), '{}'::json)
+        FROM venues v
+        GROUP BY v.city, v.state
+    ''')
+
+
+def downgrade():
+    op.drop_table('area_summary')
@@ -0,0 +1,53 @@
+"""add access path indexes
+
+Revision ID: c2e8f5a41d07
+Revises: 7a4d0c1b2e63
+Create Date: 2026-10-18 11:21:54.306177
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e8f5a41d07'
+down_revision = '7a4d0c1b2e63'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns, postgresql index method)
+INDEXES = [
+    ('ix_shows_venue_id_start_date', 'shows', ['venue_id', 'start_date'], None),
+    ('ix_shows_artist_id_start_date', 'shows', ['artist_id', 'start_date'], None),
+    # id is the keyset pagination tie-breaker of the /shows listing
+    ('ix_shows_start_date', 'shows', ['start_date', 'id'], None),
+    ('ix_venues_city_state', 'venues', ['city', 'state'], None),
+    ('ix_venues_genres', 'venues', ['genres'], 'gin'),
+    ('ix_artists_genres', 'artists', ['genres'], 'gin'),
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        with op.get_context().autocommit_block():
+            for name, table, columns, using in INDEXES:
+                op.create_index(name, table, columns, unique=False,
+                                postgresql_using=using or 'btree',
+                                postgresql_concurrently=True)
+    else:
+        for name, table, columns, using in INDEXES:
+            if using is None:
+                op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, table, columns, using in reversed(INDEXES):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    else:
+        for name, table, columns, using in reversed(INDEXES):
+            if using is None:
+                op.drop_index(name, table_name=table)
@@ -0,0 +1,41 @@
+"""add venue versions to area summary
+
+Revision ID: e5c9a2f47b13
+Revises: 4e8a1c5b7d29
+Create Date: 2026-10-18 21:04:17.530962
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c9a2f47b13'
+down_revision = '4e8a1c5b7d29'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # rewrite the venue entries the area_summary backfill made before
+    # updated_at existed as refresh_areas() writes them, with the venue's
+    # updated_at as the version of its cached directory fragment
+    op.execute('''
+        UPDATE area_summary a SET venues = coalesce((
+            SELECT json_agg(json_build_object('id', v.id, 'name', v.name,
+                                              'num_upcoming_shows', v.upcoming_shows_count,
+                                              'version', to_char(v.updated_at, 'YYYY-MM-DD"T"HH24:MI:SS.US'))
+                            ORDER BY v.id)
+            FROM venues v
+            WHERE v.city = a.city AND v.state = a.state
+        ), '[]'::json)
+    ''')
+
+
+def downgrade():
+    op.execute('''
+        UPDATE area_summary SET venues = coalesce((
+            SELECT json_agg(entry::jsonb - 'version' ORDER BY position)
+            FROM json_array_elements(venues) WITH ORDINALITY AS entries(entry, position)
+        ), '[]'::json)
+    ''')
@@ -0,0 +1,95 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import DateTime, tuple_
+from werkzeug.exceptions import BadRequest
+
+
+# Keyset (cursor) pagination.
+# A page is fetched with a range condition on an indexed, unique sort key
+# (e.g. `id` or `(start_date, id)`) instead of OFFSET, so every page costs
+# the same no matter how deep into the table it is.
+
+class KeysetPage(object):
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    payload = [value.isoformat() if isinstance(value, datetime) else value
+               for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+        if not isinstance(payload, list) or len(payload) != len(keys):
+            raise ValueError(cursor)
+        return [datetime.fromisoformat(value) if isinstance(key.type, DateTime) else value
+                for key, value in zip(keys, payload)]
+    except (ValueError, TypeError):
+        raise BadRequest('Invalid page cursor.')
+
+
+def paginate(query, keys, after=None, before=None, per_page=20, descending=False):
+    """Return one KeysetPage of `query` ordered by the columns in `keys`.
+
+    `after` continues past the last row of the previous page, `before`
+    walks back from the first row of the next one. The query must not be
+    ordered already; `keys` must identify a row uniquely.
+    """
+    keys = tuple(keys)
+    key_expr = keys[0] if len(keys) == 1 else tuple_(*keys)
+    forward = before is None
+    cursor = after if forward else before
+
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        bound = values[0] if len(keys) == 1 else tuple_(*values)
+        if forward != descending:
+            query = query.filter(key_expr > bound)
+        else:
+            query = query.filter(key_expr < bound)
+
+    # Walking backwards scans in reverse and flips the rows afterwards.
+    ascending = forward != descending
+    query = query.order_by(*[key.asc() if ascending else key.desc() for key in keys])
+    rows = query.limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    def cursor_of(row):
+        return encode_cursor([getattr(row, key.key) for key in keys])
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if more or not forward:
+            next_cursor = cursor_of(rows[-1])
+        if (more and not forward) or (forward and cursor):
+            prev_cursor = cursor_of(rows[0])
+
+    return KeysetPage(rows, next_cursor, prev_cursor)
@@ -0,0 +1,117 @@
+import itertools
+import math
+import time
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import exc, text
+
+
+# Read replica routing.
+# Replicas are configured as SQLALCHEMY_BINDS named replica_0, replica_1,
+# ... (see config.py). Safe requests (GET/HEAD) read from one replica,
+# picked round-robin among those no further behind than REPLICA_MAX_LAG;
+# with none available they fall back to the primary. Any other request
+# uses the primary, and so does the same client for a few seconds after
+# it, so the redirect that follows a write shows what was written. That
+# deadline is kept in a cookie of its own rather than the session, which
+# is signed with a per-process key and would not verify on another
+# worker; it only picks a database, so it needs no signature.
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PRIMARY_COOKIE = 'primary_until'
+
+# 0 on a server that is not replaying WAL (e.g. a local stand-in)
+LAG_QUERY = """
+SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+       END
+"""
+
+
+class ReplicaRouter(object):
+
+    def __init__(self):
+        self.db = None
+        self.names = []
+        self.max_lag = 2.0
+        self.check_interval = 1.0
+        self.sticky_seconds = 5.0
+        # replica name -> (checked at, lag in seconds or None if unreachable)
+        self._lags = {}
+        self._turn = itertools.count()
+
+    def init_app(self, app, db):
+        self.db = db
+        self.names = sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+                            if key.startswith('replica_'))
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', self.max_lag)
+        self.check_interval = app.config.get('REPLICA_LAG_CHECK_INTERVAL', self.check_interval)
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', self.sticky_seconds)
+        if self.names:
+            app.after_request(self.stick_to_primary)
+
+    def stick_to_primary(self, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(PRIMARY_COOKIE, f'{time.time() + self.sticky_seconds:.3f}',
+                                max_age=math.ceil(self.sticky_seconds), httponly=True, samesite='Lax')
+        return response
+
+    def engine_for_request(self):
+        """The replica engine serving this request, or None for the primary."""
+        if not self.names or not has_request_context():
+            return None
+        if 'db_replica' not in g:
+            g.db_replica = self.choose() if self.reads_from_replica() else None
+        return g.db_replica
+
+    def reads_from_replica(self):
+        if request.method not in SAFE_METHODS:
+            return False
+        try:
+            primary_until = float(request.cookies.get(PRIMARY_COOKIE, 0))
+        except ValueError:
+            primary_until = 0
+        return primary_until < time.time()
+
+    def choose(self):
+        start = next(self._turn)
+        for offset in range(len(self.names)):
+            name = self.names[(start + offset) % len(self.names)]
+            lag = self.lag(name)
+            if lag is not None and lag <= self.max_lag:
+                return self.db.engines[name]
+        return None
+
+    def lag(self, name):
+        now = time.monotonic()
+        checked = self._lags.get(name)
+        if checked is None or now - checked[0] > self.check_interval:
+            checked = (now, self.measure_lag(self.db.engines[name]))
+            self._lags[name] = checked
+        return checked[1]
+
+    def measure_lag(self, engine):
+        """Seconds the replica is behind the primary, or None if it cannot be reached."""
+        try:
+            with engine.connect() as connection:
+                if connection.dialect.name == 'postgresql':
+                    return float(connection.execute(text(LAG_QUERY)).scalar() or 0)
+                connection.execute(text('SELECT 1'))
+                return 0.0
+        except exc.SQLAlchemyError:
+            return None
+
+
+router = ReplicaRouter()
+
+
+class RoutingSession(Session):
+    """db.session that sends the reads of safe requests to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing:
+            replica = router.engine_for_request()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
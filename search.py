@@ -0,0 +1,142 @@
+import time
+
+from sqlalchemy import Float, cast, func, literal, literal_column, or_, table, column, text
+
+
+# Name search backends.
+# Every backend turns a search term into a `hits` subquery with the
+# columns id, name, score and total, where total is the number of
+# matching rows computed by a window function. Callers page through it
+# ordered by (score, id), so the results and the count of a search come
+# back from the same statement.
+
+class SearchEngine(object):
+    name = 'like'
+
+    def hits(self, session, model, term):
+        # Plain substring match, good enough where no index is available.
+        return session.query(
+            model.id.label('id'),
+            model.name.label('name'),
+            cast(literal(0), Float).label('score'),
+            func.count().over().label('total'),
+        ).filter(model.name.ilike(f'%{escape_like(term)}%', escape='\\')).subquery('hits')
+
+    def create_index(self, connection, model):
+        pass
+
+
+class TrigramSearch(SearchEngine):
+    """PostgreSQL search backed by pg_trgm GIN indexes on `name`.
+
+    Both the substring match and the `%` similarity operator are served by
+    the gin_trgm_ops index, and hits are ranked by similarity().
+    """
+    name = 'pg_trgm'
+
+    def hits(self, session, model, term):
+        score = func.similarity(model.name, term)
+        return session.query(
+            model.id.label('id'),
+            model.name.label('name'),
+            cast(score, Float).label('score'),
+            func.count().over().label('total'),
+        ).filter(or_(
+            model.name.ilike(f'%{escape_like(term)}%', escape='\\'),
+            model.name.op('%')(term),
+        )).subquery('hits')
+
+    def create_index(self, connection, model):
+        table_name = model.__tablename__
+        connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        connection.execute(text(
+            f'CREATE INDEX IF NOT EXISTS ix_{table_name}_name_trgm '
+            f'ON {table_name} USING gin (name gin_trgm_ops)'))
+
+
+class FTS5Search(SearchEngine):
+    """SQLite search backed by an external-content FTS5 trigram table.
+
+    Used to run and benchmark search offline. `create_index` builds
+    `<table>_fts` together with the triggers that keep it in sync; until it
+    exists, searches fall back to a LIKE scan.
+    """
+    name = 'fts5'
+
+    # the trigram tokenizer cannot match terms shorter than one trigram
+    min_term_length = 3
+    # seconds before a missing index is looked for again, so workers
+    # started before `flask search-index` pick it up
+    recheck_interval = 30.0
+
+    def __init__(self):
+        self._installed = {}
+        # table name -> time.monotonic() of the last check that found no index
+        self._missing = {}
+
+    def hits(self, session, model, term):
+        table_name = model.__tablename__
+        if len(term) < self.min_term_length or not self._has_index(session, table_name):
+            return super(FTS5Search, self).hits(session, model, term)
+
+        fts = table(f'{table_name}_fts', column('rowid'), column('rank'))
+        phrase = '"' + term.replace('"', '""') + '"'
+        return session.query(
+            model.id.label('id'),
+            model.name.label('name'),
+            # FTS5 rank is bm25(), where lower means a better match
+            cast(-fts.c.rank, Float).label('score'),
+            func.count().over().label('total'),
+        ).select_from(fts).join(model, model.id == fts.c.rowid).filter(
+            literal_column(fts.name).op('MATCH')(phrase)
+        ).subquery('hits')
+
+    def create_index(self, connection, model):
+        table_name = model.__tablename__
+        fts_name = f'{table_name}_fts'
+        for statement in (
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_name} USING fts5("
+            f"name, content='{table_name}', content_rowid='id', tokenize='trigram')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts_name}_ai AFTER INSERT ON {table_name} BEGIN "
+            f"INSERT INTO {fts_name}(rowid, name) VALUES (new.id, new.name); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts_name}_ad AFTER DELETE ON {table_name} BEGIN "
+            f"INSERT INTO {fts_name}({fts_name}, rowid, name) VALUES ('delete', old.id, old.name); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts_name}_au AFTER UPDATE OF name ON {table_name} BEGIN "
+            f"INSERT INTO {fts_name}({fts_name}, rowid, name) VALUES ('delete', old.id, old.name); "
+            f"INSERT INTO {fts_name}(rowid, name) VALUES (new.id, new.name); END",
+            f"INSERT INTO {fts_name}({fts_name}) VALUES ('rebuild')",
+        ):
+            connection.execute(text(statement))
+        self._installed[table_name] = True
+
+    def _has_index(self, session, table_name):
+        # only finding the index is remembered for good
+        if table_name in self._installed:
+            return True
+        checked = self._missing.get(table_name)
+        if checked is not None and time.monotonic() - checked < self.recheck_interval:
+            return False
+        found = session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': f'{table_name}_fts'}).first()
+        if found is None:
+            self._missing[table_name] = time.monotonic()
+            return False
+        self._installed[table_name] = True
+        self._missing.pop(table_name, None)
+        return True
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+_engines = {
+    'postgresql': TrigramSearch(),
+    'sqlite': FTS5Search(),
+}
+_default_engine = SearchEngine()
+
+
+def engine_for(dialect_name):
+    return _engines.get(dialect_name, _default_engine)
@@ -0,0 +1,159 @@
+import random
+from datetime import datetime, time as dt_time, timedelta
+from itertools import accumulate
+
+from forms import genres_choices, state_choices
+
+
+# Deterministic synthetic data for scale testing.
+# The same seed, sizes and anchor date always give the same rows. Each
+# resource gets its own random stream, so changing the number of shows
+# does not change the venues or artists. Popularity is Zipfian: a few
+# hot venues and artists get most of the shows, a few cities hold most
+# of the venues and artists, and a few genres dominate.
+
+CITY_PREFIXES = ('Spring', 'River', 'Lake', 'Oak', 'Fair', 'Green', 'Maple', 'Cedar',
+                 'Silver', 'Elm', 'Clear', 'West', 'East', 'North', 'South', 'New')
+CITY_SUFFIXES = ('field', 'ville', 'ton', 'port', 'view', 'dale', 'wood', 'burg',
+                 'ford', ' Falls', ' Springs', ' Heights', ' City')
+
+NAME_ADJECTIVES = ('Blue', 'Red', 'Golden', 'Electric', 'Velvet', 'Midnight', 'Crimson',
+                   'Silent', 'Wild', 'Neon', 'Lucky', 'Broken', 'Rusty', 'Little', 'Big')
+NAME_NOUNS = ('Owl', 'Fox', 'Anchor', 'Lantern', 'Crow', 'Harbor', 'Garden', 'Engine',
+              'Rose', 'Tiger', 'Comet', 'Bridge', 'Moon', 'River', 'Wolf')
+VENUE_KINDS = ('Hall', 'Lounge', 'Club', 'Bar', 'Theatre', 'Room', 'Tavern', 'Ballroom')
+ARTIST_KINDS = ('Band', 'Quartet', 'Collective', 'Project', 'Trio', 'Orchestra', 'Ensemble')
+STREETS = ('Main St', 'Market St', 'Broadway', '1st Ave', 'Elm St', 'Oak Ave', 'Park Rd')
+
+GENRES = [genre for genre, label in genres_choices]
+STATES = [state for state, label in state_choices]
+
+
+class SeedPlan(object):
+
+    def __init__(self, seed=0, venues=1000, artists=5000, shows=100000, skew=1.0, cities=2000,
+                 anchor=None, past_days=730, future_days=365):
+        self.seed = seed
+        self.venues = venues
+        self.artists = artists
+        self.shows = shows
+        # Zipf exponent of venue, artist, city and genre popularity
+        self.skew = skew
+        self.cities = cities
+        # shows are spread around this date (midnight today by default)
+        self.now = datetime.now()
+        self.anchor = anchor or datetime.combine(self.now.date(), dt_time())
+        self.past_days = past_days
+        self.future_days = future_days
+
+    def random(self, resource):
+        return random.Random(f'{self.seed}:{resource}')
+
+
+def zipf_cum_weights(n, s):
+    """Cumulative weights of ranks 1..n under a Zipf distribution with exponent s."""
+    return list(accumulate(1.0 / rank ** s for rank in range(1, n + 1)))
+
+
+def shuffled(rng, items):
+    items = list(items)
+    rng.shuffle(items)
+    return items
+
+
+def city_pool(plan):
+    rng = plan.random('cities')
+    # states are skewed too, so cities cluster in a few of them
+    states = shuffled(rng, STATES)
+    state_weights = zipf_cum_weights(len(states), plan.skew)
+    names = [prefix + suffix for suffix in CITY_SUFFIXES for prefix in CITY_PREFIXES]
+    cities = []
+    for i in range(plan.cities):
+        name = names[i % len(names)]
+        if i >= len(names):
+            name += f' {i // len(names) + 1}'
+        cities.append((name, rng.choices(states, cum_weights=state_weights)[0]))
+    return shuffled(rng, cities), zipf_cum_weights(len(cities), plan.skew)
+
+
+def genre_pool(plan):
+    genres = shuffled(plan.random('genres'), GENRES)
+    return genres, zipf_cum_weights(len(genres), plan.skew)
+
+
+def owner_rows(plan, resource, first_id, count, kinds):
+    rng = plan.random(resource)
+    cities, city_weights = city_pool(plan)
+    genres, genre_weights = genre_pool(plan)
+    for row_id in range(first_id, first_id + count):
+        name = f'{rng.choice(NAME_ADJECTIVES)} {rng.choice(NAME_NOUNS)} {rng.choice(kinds)}'
+        slug = name.lower().replace(' ', '') + str(row_id)
+        city, state = rng.choices(cities, cum_weights=city_weights)[0]
+        yield rng, {
+            'id': row_id,
+            'name': name,
+            'city': city,
+            'state': state,
+            'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}',
+            'genres': sorted(set(rng.choices(genres, cum_weights=genre_weights, k=rng.randint(1, 3)))),
+            'image_link': f'https://picsum.photos/seed/{slug}/300/300' if rng.random() < 0.8 else None,
+            'facebook_link': f'https://www.facebook.com/{slug}' if rng.random() < 0.6 else None,
+            'website': f'https://www.{slug}.com' if rng.random() < 0.4 else None,
+        }
+
+
+def venue_rows(plan, first_id):
+    for rng, row in owner_rows(plan, 'venues', first_id, plan.venues, VENUE_KINDS):
+        row['address'] = f'{rng.randint(1, 9999)} {rng.choice(STREETS)}'
+        row['seeking_talent'] = rng.random() < 0.2
+        row['seeking_description'] = 'We are looking for local acts.' if row['seeking_talent'] else None
+        yield row
+
+
+def artist_rows(plan, first_id):
+    for rng, row in owner_rows(plan, 'artists', first_id, plan.artists, ARTIST_KINDS):
+        row['seeking_venue'] = rng.random() < 0.3
+        row['seeking_description'] = 'Looking for shows this season.' if row['seeking_venue'] else None
+        yield row
+
+
+def show_rows(plan, first_venue_id, first_artist_id, batch_size=10000):
+    """Yield lists of show rows; venues and artists are picked by Zipfian popularity."""
+    rng = plan.random('shows')
+    # popularity rank -> id, so the hot rows are spread over the id range
+    venue_ids = shuffled(rng, range(first_venue_id, first_venue_id + plan.venues))
+    artist_ids = shuffled(rng, range(first_artist_id, first_artist_id + plan.artists))
+    venue_weights = zipf_cum_weights(plan.venues, plan.skew)
+    artist_weights = zipf_cum_weights(plan.artists, plan.skew)
+    first_day = plan.anchor - timedelta(days=plan.past_days)
+    days = plan.past_days + plan.future_days
+
+    remaining = plan.shows
+    while remaining:
+        size = min(batch_size, remaining)
+        venues = rng.choices(venue_ids, cum_weights=venue_weights, k=size)
+        artists = rng.choices(artist_ids, cum_weights=artist_weights, k=size)
+        batch = []
+        for venue_id, artist_id in zip(venues, artists):
+            # evening shows, on the hour or half hour
+            start_date = first_day + timedelta(days=rng.randrange(days), hours=rng.randint(17, 23),
+                                               minutes=rng.choice((0, 30)))
+            batch.append({
+                'venue_id': venue_id,
+                'artist_id': artist_id,
+                'start_date': start_date,
+                'upcoming': start_date > plan.now,
+            })
+        yield batch
+        remaining -= size
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,107 @@
+import hashlib
+import os
+
+from jinja2 import FileSystemBytecodeCache, TemplateError, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+# Template compilation and fragment caching.
+# Compiled templates are kept in a bytecode cache on disk, so a fresh
+# worker loads them instead of compiling them again, and every template
+# can be loaded up front by warm_templates(). The {% cache %} tag stores
+# rendered fragments, such as one show tile, in the fragment cache:
+#
+#   {% cache 'show', show.show_id, version=show.version %} ... {% endcache %}
+#
+# The key is made of the tag's positional arguments (an entity and its
+# id), so the write handlers can delete the fragments of the entities
+# they change. Entries are stamped with a checksum of the template source
+# and of the version (e.g. the newest updated_at of the rows the fragment
+# shows), and one with another stamp is treated as a miss: a worker whose
+# invalidation never reached the shared cache, or a page cache entry
+# rendered before a write, can't bring an outdated fragment back.
+
+def fragment_key(*parts):
+    return 'fragment:' + ':'.join(str(part) for part in parts)
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        version = nodes.Const(None)
+        while parser.stream.skip_if('comma'):
+            if parser.stream.current.type == 'name' and parser.stream.look().type == 'assign':
+                name = next(parser.stream)
+                if name.value != 'version':
+                    parser.fail(f'Unknown cache argument {name.value!r}', name.lineno)
+                next(parser.stream)
+                version = parser.parse_expression()
+            else:
+                parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render', [nodes.Const(self.template_version(parser.name)), nodes.List(parts),
+                                         version]),
+            [], [], body
+        ).set_lineno(lineno)
+
+    def template_version(self, name):
+        if name is None or self.environment.loader is None:
+            return ''
+        source = self.environment.loader.get_source(self.environment, name)[0]
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()[:8]
+
+    def _render(self, template_version, parts, version, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key = fragment_key(*parts)
+        stamp = template_version
+        if version is not None:
+            stamp = hashlib.sha1(f'{template_version}:{version}'.encode('utf-8')).hexdigest()[:12]
+        entry = cache.get(key)
+        if entry is not None:
+            entry_stamp, _, html = entry.partition(':')
+            if entry_stamp == stamp:
+                return Markup(html)
+        html = caller()
+        cache.set(key, stamp + ':' + str(html))
+        return html
+
+
+def init_app(app, fragment_cache):
+    directory = app.config.get('TEMPLATE_BYTECODE_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = fragment_cache
+
+
+def source_checksum(app):
+    """Checksum of the sources of all the app's templates."""
+    checksum = hashlib.sha1()
+    for name in app.jinja_env.list_templates():
+        checksum.update(name.encode('utf-8'))
+        checksum.update(app.jinja_env.loader.get_source(app.jinja_env, name)[0].encode('utf-8'))
+    return checksum.hexdigest()[:12]
+
+
+def warm_templates(app):
+    """Compile (or load from the bytecode cache) every template of the app."""
+    warmed = 0
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        try:
+            app.jinja_env.get_template(name)
+            warmed += 1
+        except TemplateError as e:
+            app.logger.warning('Could not compile template %s: %s', name, e)
+    return warmed
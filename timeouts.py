@@ -0,0 +1,84 @@
+import sqlite3
+import time
+
+from flask import has_request_context
+from sqlalchemy import event, text
+
+
+# Statement timeouts.
+# They only apply while serving requests: every transaction begun during
+# one is limited to STATEMENT_TIMEOUT_MS (config.py), and
+# limit_statement_time() can lower that for the rest of the transaction.
+# CLI commands (seed, import, refresh-areas, ...) and migrations run
+# unlimited, and only the app's own engines are hooked, not e.g. the one
+# Alembic builds. PostgreSQL enforces the limit itself (statement_timeout,
+# transaction-local). SQLite has no such setting, so a progress handler
+# interrupts any statement that runs past its deadline. Either way the
+# statement fails with an OperationalError that is_statement_timeout()
+# recognizes.
+
+# SQLite virtual machine instructions between deadline checks
+PROGRESS_INTERVAL = 10000
+
+
+def limit_statement_time(connection, timeout_ms):
+    """Cap the statements run on `connection` until its transaction ends."""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("SELECT set_config('statement_timeout', :timeout, true)"),
+                           {'timeout': str(int(timeout_ms))})
+    else:
+        connection.info['statement_timeout_ms'] = timeout_ms
+
+
+def is_statement_timeout(error):
+    orig = getattr(error, 'orig', None)
+    # 57014 is PostgreSQL's query_canceled
+    return getattr(orig, 'pgcode', None) == '57014' or (
+        isinstance(orig, sqlite3.OperationalError) and str(orig) == 'interrupted')
+
+
+def init_app(app, db):
+    default_ms = app.config.get('STATEMENT_TIMEOUT_MS') or 0
+
+    def install_progress_handler(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            info = connection_record.info
+
+            def past_deadline():
+                deadline = info.get('statement_deadline')
+                return 1 if deadline is not None and time.monotonic() > deadline else 0
+
+            dbapi_connection.set_progress_handler(past_deadline, PROGRESS_INTERVAL)
+
+    def limit_request_transaction(conn):
+        if default_ms and has_request_context():
+            limit_statement_time(conn, default_ms)
+
+    def start_deadline(conn, cursor, statement, parameters, context, executemany):
+        if conn.dialect.name == 'sqlite':
+            timeout_ms = conn.info.get('statement_timeout_ms')
+            if timeout_ms:
+                conn.info['statement_deadline'] = time.monotonic() + timeout_ms / 1000
+
+    def clear_deadline(conn, *args):
+        conn.info.pop('statement_deadline', None)
+
+    def clear_failed_deadline(context):
+        if context.connection is not None:
+            clear_deadline(context.connection)
+
+    def clear_limit(conn):
+        # like set_config(..., true), a limit ends with its transaction
+        conn.info.pop('statement_timeout_ms', None)
+        conn.info.pop('statement_deadline', None)
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'connect', install_progress_handler)
+        event.listen(engine, 'begin', limit_request_transaction)
+        event.listen(engine, 'commit', clear_limit)
+        event.listen(engine, 'rollback', clear_limit)
+        event.listen(engine, 'before_cursor_execute', start_deadline)
+        event.listen(engine, 'after_cursor_execute', clear_deadline)
+        event.listen(engine, 'handle_error', clear_failed_deadline)